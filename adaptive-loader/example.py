@@ -0,0 +1,255 @@
+""" An example of bulk loading with adaptive concurrency, backing off when AMaaS starts throttling. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from amaasutils.random_utils import random_string
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+import logging
+import logging.config
+import random
+import threading
+import time
+
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+from dateutil.relativedelta import relativedelta
+from requests.exceptions import ConnectionError, HTTPError, Timeout
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = TransactionsInterface()
+currencies = ['HKD', 'SGD', 'USD']
+
+THROTTLE_STATUS_CODES = (429, 502, 503, 504)
+CONFLICT_STATUS_CODE = 409
+
+
+def status_code(exception):
+    """ The HTTP status code behind a failed call, if there is one. """
+    response = getattr(exception, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_throttled(exception):
+    """ Whether a failure means the service is overloaded (as opposed to the request being bad). """
+    if isinstance(exception, (Timeout, ConnectionError)):
+        return True
+    return isinstance(exception, HTTPError) and status_code(exception) in THROTTLE_STATUS_CODES
+
+
+class AdaptiveConcurrencyController(object):
+    """
+    Additive-increase / multiplicative-decrease (AIMD) control of the number of requests in flight.
+
+    The window grows by roughly one slot per window's worth of healthy responses, and is cut by the backoff factor
+    on throttling or timeouts.  Responses slower than the latency target stop the window from growing.  At most one
+    decrease is applied per window's worth of responses, so a burst of failures from the same overload only backs
+    off once.
+    """
+
+    def __init__(self, initial_window=4, min_window=1, max_window=64, backoff_factor=0.5, latency_target=2.0):
+        self.min_window = min_window
+        self.max_window = max_window
+        self.backoff_factor = backoff_factor
+        self.latency_target = latency_target
+        self.window = float(initial_window)
+        self.in_flight = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retries = 0
+        self.latency_ewma = None
+        self._responses_since_decrease = initial_window
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """ Block until there is a free slot in the current window. """
+        with self._condition:
+            while self.in_flight >= int(self.window):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled=False, success=True):
+        """ Free a slot and adjust the window based on how the request went. """
+        with self._condition:
+            self.in_flight -= 1
+            self._responses_since_decrease += 1
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+            if throttled:
+                self.throttled += 1
+                if self._responses_since_decrease >= self.window:
+                    self.window = max(self.min_window, self.window * self.backoff_factor)
+                    self._responses_since_decrease = 0
+            elif success and self.latency_ewma <= self.latency_target:
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+            self._condition.notify_all()
+
+    def record_outcome(self, success):
+        with self._condition:
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def record_retry(self):
+        with self._condition:
+            self.retries += 1
+
+    def stats(self):
+        """ A snapshot of the controller state, suitable for logging or exporting as metrics. """
+        with self._condition:
+            return {'window': int(self.window),
+                    'in_flight': self.in_flight,
+                    'succeeded': self.succeeded,
+                    'failed': self.failed,
+                    'throttled': self.throttled,
+                    'retries': self.retries,
+                    'latency_ewma': self.latency_ewma}
+
+
+class AdaptiveSubmitter(object):
+    """
+    Submits AMaaS objects concurrently, paced by an AdaptiveConcurrencyController.
+
+    Throttled calls are retried with full jitter exponential backoff.  Only idempotent creates are retried - i.e.
+    objects whose ID is assigned by the client - since a retry of a create that actually reached the server would
+    otherwise book the object twice.  For idempotent creates a conflict on retry means an earlier attempt succeeded.
+    """
+
+    def __init__(self, controller=None, max_retries=5, base_delay=0.1, max_delay=10.0):
+        self.controller = controller or AdaptiveConcurrencyController()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def submit_all(self, submit_function, objects, idempotent=True):
+        """
+        Submit every object, returning a list of (object, exception) pairs for those which ultimately failed.
+        :param submit_function: The interface function to call for each object - e.g. assets_interface.new
+        :param objects: The objects to submit
+        :param idempotent: Whether the objects carry client-assigned IDs, and are therefore safe to retry
+        """
+        with ThreadPoolExecutor(max_workers=self.controller.max_window) as executor:
+            results = executor.map(lambda obj: self._submit(submit_function, obj, idempotent), objects)
+            return [(obj, error) for obj, error in results if error is not None]
+
+    def _submit(self, submit_function, obj, idempotent):
+        attempt = 0
+        while True:
+            self.controller.acquire()
+            start = time.time()
+            try:
+                submit_function(obj)
+            except Exception as e:
+                throttled = is_throttled(e)
+                self.controller.release(latency=time.time() - start, throttled=throttled, success=False)
+                if idempotent and attempt > 0 and status_code(e) == CONFLICT_STATUS_CODE:
+                    # An earlier attempt made it to the server after all
+                    self.controller.record_outcome(success=True)
+                    return obj, None
+                if not (idempotent and throttled) or attempt >= self.max_retries:
+                    self.controller.record_outcome(success=False)
+                    return obj, e
+                self.controller.record_retry()
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+                attempt += 1
+            else:
+                self.controller.release(latency=time.time() - start)
+                self.controller.record_outcome(success=True)
+                return obj, None
+
+
+def create_equity(asset_manager_id, asset_id):
+    """ Create an equity for use in this example. """
+    references = {'ISIN': Reference(reference_value=random_string(12)),
+                  'Ticker': Reference(reference_value=random_string(8))}
+
+    asset = Equity(asset_manager_id=asset_manager_id,
+                   asset_id=asset_id,
+                   currency=random.choice(currencies),
+                   references=references)
+    return asset
+
+
+def create_transaction(asset_manager_id, transaction_id, asset_book_id, cpty_book_id, asset_id, transaction_date,
+                       settlement_date):
+    quantity = Decimal(random.randint(1, 1000))
+    price = Decimal(random.random()).quantize(Decimal('0.01'))
+    transaction = Transaction(asset_manager_id=asset_manager_id, transaction_id=transaction_id,
+                              transaction_action=random.choice(['Buy', 'Sell']), asset_book_id=asset_book_id,
+                              counterparty_book_id=cpty_book_id, asset_id=asset_id,
+                              transaction_currency=random.choice(currencies),
+                              transaction_date=transaction_date, settlement_date=settlement_date, quantity=quantity,
+                              price=price)
+    return transaction
+
+
+def log_failures(failures):
+    for obj, error in failures:
+        logging.error("Failed to submit %s: %s", obj, error)
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    brokers = ['BROKER1', 'BROKER2']
+    no_of_books = 5
+    no_of_equities = 100
+    no_of_transactions = 5000
+    currency = 'USD'
+    today = date.today()
+    settlement_date = today + relativedelta(days=2)
+    submitter = AdaptiveSubmitter()
+
+    logging.info("--- SETTING UP PARTIES ---")
+    parties_interface.new(Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id,
+                                  base_currency=currency))
+    for broker_id in brokers:
+        parties_interface.new(Broker(asset_manager_id=asset_manager_id, party_id=broker_id))
+
+    logging.info("--- SETTING UP BOOKS ---")
+    book_ids = ['BOOK' + str(i+1) for i in range(no_of_books)]
+    books = [Book(asset_manager_id=asset_manager_id, book_id=book_id, party_id=asset_manager_party_id)
+             for book_id in book_ids]
+    books += [Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id) for broker_id in brokers]
+    log_failures(submitter.submit_all(books_interface.new, books))
+
+    logging.info("--- SETTING UP EQUITIES ---")
+    equities = [create_equity(asset_manager_id=asset_manager_id, asset_id='EQ' + str(i+1))
+                for i in range(no_of_equities)]
+    log_failures(submitter.submit_all(assets_interface.new, equities))
+    logging.info("Controller: %s", submitter.controller.stats())
+
+    logging.info("--- BOOKING TRADES ---")
+    transactions = []
+    for i in range(no_of_transactions):
+        transactions.append(create_transaction(asset_manager_id=asset_manager_id, transaction_id=str(i+1),
+                                               asset_book_id=random.choice(book_ids),
+                                               cpty_book_id=random.choice(brokers),
+                                               asset_id='EQ' + str(random.randint(1, no_of_equities)),
+                                               transaction_date=today, settlement_date=settlement_date))
+    start = time.time()
+    log_failures(submitter.submit_all(transaction_interface.new, transactions))
+    elapsed = time.time() - start
+    logging.info("Booked %s trades in %.1fs (%.1f trades/sec)", no_of_transactions, elapsed,
+                 no_of_transactions / elapsed)
+    logging.info("Controller: %s", submitter.controller.stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+""" An example of coalescing rapid amends and cancels of the same transaction into as few writes as possible. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from decimal import Decimal
+import logging.config
+import random
+import time
+
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = TransactionsInterface()
+
+AMEND = 'Amend'
+CANCEL = 'Cancel'
+
+
+class CoalescingTransactionsWriter(object):
+    """
+    Buffers amends and cancels per transaction, so that a burst of lifecycle events costs a single write.
+
+    - Successive amends of a transaction are merged - only the latest version is sent.  While an amend is buffered,
+      further amends must be made to the object returned by retrieve().  Amending any other copy (e.g. one
+      retrieved from AMaaS directly) raises ValueError, since sending it would silently discard the buffered changes.
+    - An amend followed by a cancel is reduced to just the cancel.
+
+    Events are held until the window has passed since the first buffered event for that transaction, or until
+    flush() is called.  There is no background thread - expired events are sent on the next call to the writer, so
+    call flush() before reading positions that should reflect the buffered changes.  New transactions are not
+    buffered, since they need to exist before they can be amended.
+    """
+
+    def __init__(self, transactions_interface, window=5.0):
+        self.transactions_interface = transactions_interface
+        self.window = window
+        self.events = 0
+        self.coalesced = 0
+        self.writes = 0
+        self._pending = OrderedDict()  # (asset_manager_id, transaction_id) -> [action, transaction, first_event_time]
+
+    def new(self, transaction):
+        self.flush_expired()
+        return self.transactions_interface.new(transaction)
+
+    def retrieve(self, asset_manager_id, transaction_id):
+        """ Return the buffered version of the transaction if there is one, so callers see their own amends. """
+        pending = self._pending.get((asset_manager_id, transaction_id))
+        if pending and pending[0] == AMEND:
+            return pending[1]
+        return self.transactions_interface.retrieve(asset_manager_id=asset_manager_id, transaction_id=transaction_id)
+
+    def amend(self, transaction):
+        key = (transaction.asset_manager_id, transaction.transaction_id)
+        pending = self._pending.get(key)
+        if pending and pending[0] == CANCEL:
+            raise ValueError('Transaction %s has a pending cancel and cannot be amended' % transaction.transaction_id)
+        if pending and pending[1] is not transaction:
+            raise ValueError('Transaction %s has a pending amend - amend the transaction returned by retrieve() '
+                             'instead' % transaction.transaction_id)
+        self.events += 1
+        if pending:
+            self.coalesced += 1
+        else:
+            self._pending[key] = [AMEND, transaction, time.time()]
+        self.flush_expired()
+
+    def cancel(self, asset_manager_id, transaction_id):
+        key = (asset_manager_id, transaction_id)
+        pending = self._pending.get(key)
+        self.events += 1
+        if pending:
+            pending[0], pending[1] = CANCEL, None
+            self.coalesced += 1
+        else:
+            self._pending[key] = [CANCEL, None, time.time()]
+        self.flush_expired()
+
+    def pending(self):
+        return len(self._pending)
+
+    def flush_expired(self):
+        """ Send all events which have been buffered for longer than the window. """
+        cutoff = time.time() - self.window
+        return self._flush([key for key, (_, _, first_event_time) in self._pending.items()
+                            if first_event_time <= cutoff])
+
+    def flush(self, asset_manager_id=None, transaction_id=None):
+        """ Send the buffered events for one transaction, or for all transactions if no transaction is given. """
+        if transaction_id is None:
+            return self._flush(list(self._pending.keys()))
+        return self._flush([key for key in [(asset_manager_id, transaction_id)] if key in self._pending])
+
+    def _flush(self, keys):
+        """ Send the events in the order they were first buffered.  A failed event stays buffered for a retry. """
+        for key in keys:
+            action, transaction, _ = self._pending[key]
+            if action == AMEND:
+                self.transactions_interface.amend(transaction)
+            else:
+                self.transactions_interface.cancel(asset_manager_id=key[0], transaction_id=key[1])
+            del self._pending[key]
+            self.writes += 1
+        return len(keys)
+
+    def stats(self):
+        return {'events': self.events, 'coalesced': self.coalesced, 'writes': self.writes,
+                'pending': len(self._pending)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+
+def create_assets(asset_manager_id):
+    singtel_symbol = 'Z77.SI'
+    singtel_references = {'ISIN': Reference(reference_value='SG1T75931496'),
+                          'Ticker': Reference(reference_value=singtel_symbol)}
+
+    singtel = Equity(asset_manager_id=asset_manager_id, asset_id=singtel_symbol,
+                     currency='SGD', references=singtel_references)
+
+    assets_interface.new(singtel)
+    return singtel
+
+
+def create_parties(asset_manager_id, asset_manager_party_id, broker_id, base_currency):
+
+    asset_manager = Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id,
+                            base_currency=base_currency)
+    parties_interface.new(asset_manager)
+    broker = Broker(asset_manager_id=asset_manager_id, party_id=broker_id)
+    parties_interface.new(broker)
+    return asset_manager, broker
+
+
+def create_books(asset_manager_id, asset_manager_party_id, trading_book_id, broker_id):
+    trading_book = Book(asset_manager_id=asset_manager_id, book_id=trading_book_id, party_id=asset_manager_party_id)
+    books_interface.new(trading_book)
+
+    broker_book = Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id,
+                       book_type='Counterparty')
+    books_interface.new(broker_book)
+
+    return trading_book, broker_book
+
+
+def book_transaction(writer, asset_manager_id, asset_book_id, counterparty_book_id, asset, transaction_date,
+                     settlement_date, quantity):
+    transaction = Transaction(asset_manager_id=asset_manager_id,
+                              transaction_action='Buy',
+                              asset_book_id=asset_book_id,
+                              counterparty_book_id=counterparty_book_id,
+                              asset_id=asset.asset_id,
+                              transaction_currency=asset.currency,
+                              transaction_date=transaction_date,
+                              settlement_date=settlement_date,
+                              quantity=quantity,
+                              price=Decimal('3.92'))
+    transaction = writer.new(transaction)
+    return transaction.transaction_id
+
+
+def log_positions(asset_manager_id):
+    positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
+    for position in positions:
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
+
+
+def main():
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    trading_book_id = 'DEMO-BOOK'
+    broker_id = 'BROKER'
+    currency = 'USD'
+    today = date.today()
+    overmorrow = today + relativedelta(days=2)
+    writer = CoalescingTransactionsWriter(transactions_interface=transaction_interface, window=30.0)
+
+    logging.info("--- SETTING UP BOOKS ---")
+    trading_book, broker_book = create_books(asset_manager_id=asset_manager_id,
+                                             asset_manager_party_id=asset_manager_party_id,
+                                             trading_book_id=trading_book_id, broker_id=broker_id)
+
+    logging.info("--- SETTING UP PARTIES ---")
+    create_parties(asset_manager_id=asset_manager_id, asset_manager_party_id=asset_manager_party_id,
+                   broker_id=broker_id, base_currency=currency)
+
+    logging.info("--- SETTING UP ASSETS ---")
+    singtel = create_assets(asset_manager_id=asset_manager_id)
+
+    logging.info("--- BOOKING TRADES ---")
+    t_id1 = book_transaction(writer=writer, asset_manager_id=asset_manager_id, asset_book_id=trading_book.book_id,
+                             counterparty_book_id=broker_book.book_id, asset=singtel, transaction_date=today,
+                             settlement_date=overmorrow, quantity=Decimal('100'))
+    t_id2 = book_transaction(writer=writer, asset_manager_id=asset_manager_id, asset_book_id=trading_book.book_id,
+                             counterparty_book_id=broker_book.book_id, asset=singtel, transaction_date=today,
+                             settlement_date=overmorrow, quantity=Decimal('150'))
+    log_positions(asset_manager_id=asset_manager_id)
+
+    logging.info("--- AMEND THE FIRST TRADE THREE TIMES ---")
+    transaction = writer.retrieve(asset_manager_id=asset_manager_id, transaction_id=t_id1)
+    transaction.quantity = Decimal('120')
+    writer.amend(transaction)
+    transaction = writer.retrieve(asset_manager_id=asset_manager_id, transaction_id=t_id1)
+    transaction.price = Decimal('3.95')
+    writer.amend(transaction)
+    transaction = writer.retrieve(asset_manager_id=asset_manager_id, transaction_id=t_id1)
+    transaction.settlement_date = today + relativedelta(days=3)
+    writer.amend(transaction)
+
+    logging.info("--- AMEND THE SECOND TRADE, THEN CANCEL IT ---")
+    transaction = writer.retrieve(asset_manager_id=asset_manager_id, transaction_id=t_id2)
+    transaction.quantity = Decimal('175')
+    writer.amend(transaction)
+    writer.cancel(asset_manager_id=asset_manager_id, transaction_id=t_id2)
+    logging.info("Pending events: %s", writer.pending())
+
+    logging.info("--- FLUSH ---")
+    writer.flush()
+    logging.info("Writer stats: %s", writer.stats())
+
+    logging.info("--- CURRENT POSITIONS AFTER FLUSH ---")
+    log_positions(asset_manager_id=asset_manager_id)
+
+if __name__ == '__main__':
+    main()
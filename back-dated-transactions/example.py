@@ -118,7 +118,7 @@ def main():
     logging.info("--- CURRENT POSITIONS AFTER FIRST TRADE ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- BOOKING A TRADE FROM YESTERDAY ---")
     t_id2 = book_transaction(asset_manager_id=asset_manager_id, asset_book_id=trading_book.book_id,
@@ -129,7 +129,7 @@ def main():
     logging.info("--- CURRENT POSITIONS AFTER SECOND TRADE ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- BOOKING A TRADE FROM EREYESTERDAY ---")
     t_id3 = book_transaction(asset_manager_id=asset_manager_id, asset_book_id=trading_book.book_id,
@@ -140,7 +140,7 @@ def main():
     logging.info("--- CURRENT POSITIONS AFTER THIRD TRADE ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- YESTERDAY'S POSITIONS AFTER THIRD TRADE ---")
     positions = transaction_interface.position_search(asset_manager_ids=[asset_manager_id],
@@ -148,7 +148,7 @@ def main():
                                                       accounting_types=['Transaction Date'],
                                                       position_date=yesterday)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- CANCEL YESTERDAY'S TRADE ---")
     transaction_interface.cancel(asset_manager_id=asset_manager_id, transaction_id=t_id2)
@@ -156,7 +156,7 @@ def main():
     logging.info("--- CURRENT POSITIONS AFTER CANCELLATION ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- YESTERDAY'S POSITIONS AFTER CANCELLATION ---")
     positions = transaction_interface.position_search(asset_manager_ids=[asset_manager_id],
@@ -164,7 +164,7 @@ def main():
                                                       accounting_types=['Transaction Date'],
                                                       position_date=yesterday)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- AMEND EREYESTERDAY'S TRADE ---")
     transaction = transaction_interface.retrieve(asset_manager_id=asset_manager_id, transaction_id=t_id3)
@@ -174,7 +174,7 @@ def main():
     logging.info("--- CURRENT POSITIONS AFTER AMEND ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- YESTERDAY'S POSITIONS AFTER AMEND ---")
     positions = transaction_interface.position_search(asset_manager_ids=[asset_manager_id],
@@ -182,7 +182,7 @@ def main():
                                                       accounting_types=['Transaction Date'],
                                                       position_date=yesterday)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
 if __name__ == '__main__':
     main()
@@ -106,7 +106,7 @@ def main():
     logging.info("--- POSITIONS AFTER FIRST TRADE ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
     logging.info("--- DO A BOOK TRANSFER ---")
     transaction_interface.book_transfer(asset_manager_id=asset_manager_id,
@@ -121,7 +121,7 @@ def main():
     logging.info("--- POSITIONS AFTER BOOK TRANSFER ---")
     positions = transaction_interface.positions_by_asset_manager(asset_manager_id=asset_manager_id)
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,227 @@
+""" An example of streaming AMaaS Core Objects to (optionally compressed) CSV files, exporting only what changed. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from amaasutils.random_utils import random_string
+import csv
+from dateutil.parser import parse
+import gzip
+import io
+import json
+import logging
+import logging.config
+import os
+import random
+import tempfile
+
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.tools.generate_transaction import generate_transaction
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = TransactionsInterface()
+currencies = ['HKD', 'SGD', 'USD']
+
+
+def open_csv(filename, mode, compress, buffer_size=1024 * 1024):
+    """ Open a CSV file as text, either through gzip or through a large buffer. """
+    if compress:
+        raw = gzip.GzipFile(filename=filename, mode=mode + 'b')
+    else:
+        raw = io.open(filename, mode + 'b', buffering=buffer_size)
+    return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+
+
+def read_header(filename, compress):
+    """ The field names of an existing CSV file, or None if there isn't one. """
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return None
+    with open_csv(filename, 'r', compress=compress) as f:
+        return next(csv.reader(f), None)
+
+
+def stream_objects_to_csv(objects, filename, clazz=None, compress=False, append=False):
+    """
+    Write objects to a CSV file from any iterable, without holding them all in memory.
+
+    The columns match objects_to_csv, so the output can be read back with csv_filename_to_objects.  When appending,
+    the existing header is reused and no new one is written.  Appending to a gzip file adds a new gzip member, which
+    gzip readers treat as one continuous stream.
+    :return: The number of objects written
+    """
+    objects = iter(objects)
+    first = next(objects, None)
+    if first is None:
+        return 0
+    children = list(clazz.children().keys()) if clazz and hasattr(clazz, 'children') else []
+
+    def to_row(obj):
+        obj_dict = obj.to_json()
+        for child in children:
+            obj_dict.pop(child, None)
+        return obj_dict
+
+    first_row = to_row(first)
+    fieldnames = read_header(filename, compress=compress) if append else None
+    count = 0
+    with open_csv(filename, 'a' if append else 'w', compress=compress) as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames or list(first_row.keys()))
+        if not fieldnames:
+            writer.writeheader()
+        writer.writerow(first_row)
+        count += 1
+        for obj in objects:
+            writer.writerow(to_row(obj))
+            count += 1
+    return count
+
+
+def as_datetime(value):
+    return parse(value) if isinstance(value, str) else value
+
+
+class IncrementalExporter(object):
+    """
+    Appends objects created or amended since the last export to a CSV file.
+
+    The watermark - the latest updated_time exported, and the IDs exported at exactly that time - is kept in a JSON
+    file next to the export.  It is only moved forward once the rows have been written, so an export which fails
+    part way is repeated in full next time.  Objects without an updated_time (i.e. which did not come from AMaaS)
+    are always exported.
+    """
+
+    def __init__(self, filename, clazz, id_attribute, compress=False):
+        self.filename = filename
+        self.clazz = clazz
+        self.id_attribute = id_attribute
+        self.compress = compress
+        self.watermark_filename = filename + '.watermark'
+
+    def read_watermark(self):
+        if not os.path.exists(self.watermark_filename):
+            return None, set()
+        with open(self.watermark_filename) as f:
+            watermark = json.load(f)
+        return parse(watermark['updated_time']), set(watermark['ids'])
+
+    def write_watermark(self, updated_time, ids):
+        temp_filename = self.watermark_filename + '.tmp'
+        with open(temp_filename, 'w') as f:
+            json.dump({'updated_time': updated_time.isoformat(), 'ids': sorted(ids)}, f)
+        os.replace(temp_filename, self.watermark_filename)
+
+    def export(self, objects):
+        """
+        :param objects: An iterable of objects - e.g. from transaction_interface.search - in any order
+        :return: The number of objects appended
+        """
+        watermark, watermark_ids = self.read_watermark()
+        state = {'updated_time': watermark, 'ids': set(watermark_ids)}
+
+        def changed(objects):
+            for obj in objects:
+                updated_time = as_datetime(obj.updated_time or obj.created_time)
+                object_id = getattr(obj, self.id_attribute)
+                if updated_time is None:
+                    yield obj
+                    continue
+                if watermark is not None and (updated_time < watermark or
+                                              (updated_time == watermark and object_id in watermark_ids)):
+                    continue
+                if state['updated_time'] is None or updated_time > state['updated_time']:
+                    state['updated_time'], state['ids'] = updated_time, set()
+                if updated_time == state['updated_time']:
+                    state['ids'].add(object_id)
+                yield obj
+
+        count = stream_objects_to_csv(objects=changed(objects), filename=self.filename, clazz=self.clazz,
+                                      compress=self.compress, append=True)
+        if state['updated_time'] is not None and (state['updated_time'], state['ids']) != (watermark, watermark_ids):
+            self.write_watermark(state['updated_time'], state['ids'])
+        return count
+
+
+def create_equity(asset_manager_id, asset_id):
+    """ Create an equity for use in this example. """
+    references = {'ISIN': Reference(reference_value=random_string(12)),
+                  'Ticker': Reference(reference_value=random_string(8))}
+    asset = Equity(asset_manager_id=asset_manager_id, asset_id=asset_id, currency=random.choice(currencies),
+                   references=references)
+    assets_interface.new(asset)
+    return asset
+
+
+def book_transactions(asset_manager_id, asset_ids, asset_book_ids, cpty_book_ids, transaction_ids):
+    for transaction_id in transaction_ids:
+        transaction = generate_transaction(asset_manager_id=asset_manager_id, transaction_id=transaction_id,
+                                           asset_id=random.choice(asset_ids),
+                                           asset_book_id=random.choice(asset_book_ids),
+                                           counterparty_book_id=random.choice(cpty_book_ids))
+        transaction_interface.new(transaction)
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    csv_path = tempfile.mkdtemp()  # Modify this to keep the export and its watermark between runs
+    asset_book_ids = ['BOOK' + str(i+1) for i in range(5)]
+    broker_ids = ['BROKER1', 'BROKER2']
+    asset_ids = ['EQ' + str(i+1) for i in range(10)]
+
+    logging.info("--- SETTING UP PARTIES, BOOKS AND EQUITIES ---")
+    parties_interface.new(Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id,
+                                  base_currency='USD'))
+    for broker_id in broker_ids:
+        parties_interface.new(Broker(asset_manager_id=asset_manager_id, party_id=broker_id))
+        books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id))
+    for book_id in asset_book_ids:
+        books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=book_id, party_id=asset_manager_party_id))
+    for asset_id in asset_ids:
+        create_equity(asset_manager_id=asset_manager_id, asset_id=asset_id)
+
+    logging.info("--- BOOKING THE FIRST DAY'S TRANSACTIONS ---")
+    book_transactions(asset_manager_id=asset_manager_id, asset_ids=asset_ids, asset_book_ids=asset_book_ids,
+                      cpty_book_ids=broker_ids, transaction_ids=[str(i+1) for i in range(50)])
+
+    transactions_filename = os.path.join(csv_path, 'transactions.csv.gz')
+    exporter = IncrementalExporter(filename=transactions_filename, clazz=Transaction, id_attribute='transaction_id',
+                                   compress=True)
+    logging.info("--- FIRST EXPORT TO %s ---", transactions_filename)
+    transactions = transaction_interface.search(asset_manager_ids=[asset_manager_id])
+    logging.info("Exported %s transactions", exporter.export(transactions))
+
+    logging.info("--- BOOKING AND AMENDING THE NEXT DAY'S TRANSACTIONS ---")
+    book_transactions(asset_manager_id=asset_manager_id, asset_ids=asset_ids, asset_book_ids=asset_book_ids,
+                      cpty_book_ids=broker_ids, transaction_ids=[str(i+1) for i in range(50, 60)])
+    for transaction_id in ['1', '2', '3']:
+        transaction = transaction_interface.retrieve(asset_manager_id=asset_manager_id, transaction_id=transaction_id)
+        transaction.quantity = transaction.quantity + 1
+        transaction_interface.amend(transaction)
+
+    logging.info("--- INCREMENTAL EXPORT TO %s ---", transactions_filename)
+    transactions = transaction_interface.search(asset_manager_ids=[asset_manager_id])
+    logging.info("Exported %s transactions", exporter.export(transactions))
+
+    logging.info("--- FULL STREAMING EXPORT OF BOOKS ---")
+    books_filename = os.path.join(csv_path, 'books.csv')
+    books = books_interface.search(asset_manager_ids=[asset_manager_id])
+    logging.info("Exported %s books to %s", stream_objects_to_csv(objects=books, filename=books_filename, clazz=Book),
+                 books_filename)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+""" An example of registering typed custom assets, and casting returned CustomAssets back to them in bulk. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from amaascore.assets.custom_asset import CustomAsset
+from amaascore.assets.interface import AssetsInterface
+from amaascore.config import DEFAULT_LOGGING
+from datetime import date
+from dateutil.parser import parse
+from decimal import Decimal
+import json
+import logging.config
+import random
+import time
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+TYPE_KEY = 'custom_asset_type'
+CUSTOM_ASSET_TYPES = {}
+
+# How each declared field type is converted to and from JSON.  Anything else is stored as is.
+FIELD_CODECS = {Decimal: (str, Decimal),
+                date: (lambda value: value.isoformat(), lambda value: parse(value).date())}
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+_decoder = json.JSONDecoder()
+
+
+class CustomAssetType(type):
+    """
+    Metaclass for custom assets with a declared schema, e.g. fields = (('size', str), ('toppings', list)).
+
+    Each declared field becomes a slot, which keeps it out of __dict__ and so out of the serialised asset (it is sent
+    in client_additional instead).  The instances still have a __dict__ for the CustomAsset attributes, so this
+    saves no memory.  The class is registered under its name so that CustomAssets returned by AMaaS can be cast back
+    to it.  The (name, encode, decode) functions for the fields are worked out once here,
+    rather than on every object.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = namespace.get('fields', ())
+        namespace['__slots__'] = tuple(field_name for field_name, _ in fields)
+        clazz = super(CustomAssetType, mcs).__new__(mcs, name, bases, namespace)
+        if fields:
+            # Fields are cumulative, so a subclass of a registered type keeps its parent's fields too
+            clazz._codecs = getattr(clazz, '_codecs', []) + [(field_name,) + FIELD_CODECS.get(field_type, (None, None))
+                                                             for field_name, field_type in fields]
+            CUSTOM_ASSET_TYPES[name] = clazz
+        elif not hasattr(clazz, '_codecs'):
+            clazz._codecs = []
+        return clazz
+
+
+class RegisteredCustomAsset(CustomAssetType(str('RegisteredCustomAssetBase'), (CustomAsset,), {})):
+    """
+    A CustomAsset whose declared fields are packed into client_additional, tagged with the asset's type name.
+
+    client_additional is always encoded from the fields when the asset is serialised, so the fields can be changed
+    freely after construction.  The asset is always sent as a CustomAsset - otherwise the SDK would send the
+    subclass name as the asset_type, and a registered type sharing its name with an SDK asset class (e.g. Wine)
+    would come back as that class.
+    """
+
+    def __init__(self, asset_manager_id, asset_id, client_additional=None, fungible=False, *args, **kwargs):
+        for field_name, _, _ in self._codecs:
+            setattr(self, field_name, kwargs.pop(field_name, None))
+        super(RegisteredCustomAsset, self).__init__(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                                    client_additional=client_additional, fungible=fungible,
+                                                    *args, **kwargs)
+        self.asset_type = 'CustomAsset'
+        self.asset_type_display = 'Custom Asset'
+
+    @property
+    def client_additional(self):
+        return self.encode_client_additional()
+
+    @client_additional.setter
+    def client_additional(self, value):
+        """ Only an explicit value is decoded - passing None leaves the fields set in the constructor alone. """
+        if value is not None:
+            self.decode_client_additional(_decoder.decode(value))
+        self._client_additional = value
+
+    def encode_client_additional(self):
+        payload = {TYPE_KEY: type(self).__name__}
+        for field_name, encode, _ in self._codecs:
+            value = getattr(self, field_name)
+            payload[field_name] = encode(value) if encode and value is not None else value
+        return _encoder.encode(payload)
+
+    def decode_client_additional(self, payload):
+        for field_name, _, decode in self._codecs:
+            value = payload.get(field_name)
+            setattr(self, field_name, decode(value) if decode and value is not None else value)
+
+    def to_dict(self, dict_to_convert=None):
+        # client_additional is serialised from __dict__, so refresh it from the current field values first
+        self._client_additional = self.encode_client_additional()
+        return super(RegisteredCustomAsset, self).to_dict(dict_to_convert=dict_to_convert)
+
+
+def cast_custom_assets(assets, default_type=None):
+    """
+    Cast CustomAssets (e.g. as returned by assets_interface.search) to their registered types in a single pass.
+
+    The type comes from the tag in client_additional, falling back to default_type for untagged assets.  Each cast
+    copies the attributes already parsed by the SDK and decodes client_additional once - the asset is not
+    round-tripped through to_dict() and the constructor.  Assets which can't be cast are returned unchanged.
+    """
+    cast = []
+    for asset in assets:
+        client_additional = getattr(asset, 'client_additional', None)
+        if not client_additional or isinstance(asset, RegisteredCustomAsset):
+            cast.append(asset)
+            continue
+        try:
+            payload = _decoder.decode(client_additional)
+        except ValueError:
+            cast.append(asset)
+            continue
+        clazz = CUSTOM_ASSET_TYPES.get(payload.get(TYPE_KEY)) if isinstance(payload, dict) else None
+        clazz = clazz or default_type
+        if clazz is None:
+            cast.append(asset)
+            continue
+        custom_asset = clazz.__new__(clazz)
+        attributes = custom_asset.__dict__
+        attributes.update(asset.__dict__)
+        attributes['_client_additional'] = attributes.pop('client_additional')
+        custom_asset.decode_client_additional(payload)
+        cast.append(custom_asset)
+    return cast
+
+
+class Pizza(RegisteredCustomAsset):
+    fields = (('size', str), ('toppings', list))
+
+
+class FineWine(RegisteredCustomAsset):
+    fields = (('vintage', int), ('bottled', date), ('purchase_price', Decimal))
+
+
+def main():
+    logging.info("--- SETTING UP ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    assets_interface = AssetsInterface()
+
+    logging.info("--- CREATING CUSTOM ASSETS ---")
+    pizza = Pizza(asset_id='pizza1', asset_manager_id=asset_manager_id,
+                  size='Large', toppings=['pineapple', 'corn', 'garlic'])
+    wine = FineWine(asset_id='wine1', asset_manager_id=asset_manager_id,
+                    vintage=1982, bottled=date(1984, 6, 1), purchase_price=Decimal('1250.00'))
+    logging.info("PIZZA CLIENT ADDITIONAL: %s", pizza.client_additional)
+
+    logging.info("--- SENDING CUSTOM ASSETS TO AMAAS ---")
+    assets_interface.new(pizza)
+    assets_interface.new(wine)
+
+    logging.info("--- RETRIEVING AND CASTING CUSTOM ASSETS ---")
+    assets = assets_interface.search(asset_manager_ids=[asset_manager_id])
+    logging.info("RETURNED TYPES ARE: %s", ', '.join(type(asset).__name__ for asset in assets))
+    for asset in cast_custom_assets(assets):
+        logging.info("%s TYPE IS: %s", asset.asset_id, type(asset).__name__)
+        if isinstance(asset, Pizza):
+            logging.info("PIZZA TOPPINGS ARE: %s", ', '.join(asset.toppings))
+        elif isinstance(asset, FineWine):
+            logging.info("WINE BOTTLED ON: %s FOR %s", asset.bottled, asset.purchase_price)
+
+    logging.info("--- BULK CASTING ---")
+    no_of_assets = 100000
+    pizzas = [CustomAsset(asset_manager_id=asset_manager_id, asset_id='pizza' + str(i),
+                          client_additional=pizza.client_additional) for i in range(no_of_assets)]
+    start = time.time()
+    cast_custom_assets(pizzas)
+    logging.info("Cast %s assets in %.2fs", no_of_assets, time.time() - start)
+
+if __name__ == '__main__':
+    main()
@@ -113,7 +113,7 @@ def main():
     positions = transaction_interface.position_search(asset_manager_ids=[asset_manager_id], asset_ids=[fund_id],
                                                       accounting_types=['Transaction Date'])
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
 if __name__ == '__main__':
     main()
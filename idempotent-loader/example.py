@@ -0,0 +1,300 @@
+""" An example of a loader which can be safely re-run, skipping objects AMaaS already has and amending changed ones. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from datetime import date, datetime, time
+from decimal import Decimal
+import hashlib
+import json
+import logging
+import logging.config
+import math
+import os
+import random
+import sqlite3
+import struct
+import tempfile
+
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.core.amaas_model import AMaaSModel
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+from dateutil.relativedelta import relativedelta
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = TransactionsInterface()
+currencies = ['HKD', 'SGD', 'USD']
+
+# The attribute holding each entity type's ID
+ID_ATTRIBUTES = {'asset': 'asset_id', 'book': 'book_id', 'party': 'party_id', 'transaction': 'transaction_id'}
+NEW, CHANGED, UNCHANGED = 'new', 'changed', 'unchanged'
+
+
+def canonical(value):
+    """
+    Convert a value to plain JSON types, for hashing.  The attributes AMaaS sets itself (created_time, version etc)
+    are left out at every level, and Decimals are normalised so that 1.50 and 1.5 match.
+    """
+    if isinstance(value, AMaaSModel):
+        value = {key: item for key, item in value.to_dict().items() if key not in AMaaSModel.amaas_model_attributes()}
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, set):
+        return sorted(canonical(item) for item in value)
+    if isinstance(value, Decimal):
+        return value.normalize().to_eng_string()
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def content_hash(obj):
+    content = json.dumps(canonical(obj), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class BloomFilter(object):
+    """ A fixed size Bloom filter over strings, with the bit positions taken from a single md5 (double hashing). """
+
+    def __init__(self, capacity, error_rate):
+        self.size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        first, second = struct.unpack('<QQ', hashlib.md5(key.encode('utf-8')).digest())
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class SubmissionIndex(object):
+    """
+    A local record of the objects AMaaS has acknowledged: (entity type, asset_manager_id, id) -> content hash.
+
+    The records are kept in SQLite, with a Bloom filter of the keys held in memory in front.  Most objects in a first
+    load are new, and the filter answers those without touching the database.  Only objects the filter may have seen
+    are looked up.  The filter is sized for capacity keys - past that, more lookups go to the database but the
+    answers are still correct.
+    """
+
+    def __init__(self, filename, capacity=1000000, error_rate=0.001):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS submissions ('
+                                'entity_type TEXT, asset_manager_id INTEGER, entity_id TEXT, content_hash TEXT, '
+                                'version INTEGER, PRIMARY KEY (entity_type, asset_manager_id, entity_id))')
+        self.connection.commit()
+        self.bloom_filter = BloomFilter(capacity=capacity, error_rate=error_rate)
+        for row in self.connection.execute('SELECT entity_type, asset_manager_id, entity_id FROM submissions'):
+            self.bloom_filter.add(self._key(*row))
+
+    @staticmethod
+    def _key(entity_type, asset_manager_id, entity_id):
+        return '%s|%s|%s' % (entity_type, asset_manager_id, entity_id)
+
+    def status(self, entity_type, obj):
+        """
+        :return: (NEW, CHANGED or UNCHANGED, the version last acknowledged by AMaaS or None)
+        """
+        entity_id = getattr(obj, ID_ATTRIBUTES[entity_type])
+        if self._key(entity_type, obj.asset_manager_id, entity_id) not in self.bloom_filter:
+            return NEW, None
+        row = self.connection.execute('SELECT content_hash, version FROM submissions '
+                                      'WHERE entity_type = ? AND asset_manager_id = ? AND entity_id = ?',
+                                      (entity_type, obj.asset_manager_id, entity_id)).fetchone()
+        if row is None:
+            return NEW, None
+        return (UNCHANGED if row[0] == content_hash(obj) else CHANGED), row[1]
+
+    def record(self, entity_type, objects, commit=True):
+        """ Record objects which AMaaS has acknowledged, with the versions it returned. """
+        rows = []
+        for obj in objects:
+            entity_id = getattr(obj, ID_ATTRIBUTES[entity_type])
+            rows.append((entity_type, obj.asset_manager_id, entity_id, content_hash(obj), obj.version))
+            self.bloom_filter.add(self._key(entity_type, obj.asset_manager_id, entity_id))
+        self.connection.executemany('INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?)', rows)
+        if commit:
+            self.connection.commit()
+
+    def populate_from_server(self, asset_manager_id, interfaces):
+        """
+        Record everything AMaaS already has for an asset manager, with one search per entity type - e.g. for a first
+        run with an existing asset manager, or after the index has been lost.
+        :param interfaces: A dict of entity type -> interface, e.g. {'book': books_interface}
+        :return: A dict of entity type -> the number of objects recorded
+        """
+        counts = {}
+        for entity_type, interface in interfaces.items():
+            objects = interface.search(asset_manager_ids=[asset_manager_id])
+            self.record(entity_type, objects)
+            counts[entity_type] = len(objects)
+        return counts
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class IdempotentLoader(object):
+    """
+    Sends only what AMaaS doesn't already have: new objects are created, changed objects are amended and unchanged
+    objects are skipped without a request.
+
+    Each object is recorded in the index once AMaaS has acknowledged it, committing every commit_every objects.  If
+    a run is interrupted, objects acknowledged since the last commit are sent again as new on the next run, and
+    rejected - populate_from_server catches up with them.
+    """
+
+    def __init__(self, index, commit_every=100):
+        self.index = index
+        self.commit_every = commit_every
+
+    def load(self, entity_type, objects, interface):
+        """
+        :return: A dict with the count of created, amended, skipped and failed objects, and the errors
+        """
+        counts = {'created': 0, 'amended': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        uncommitted = 0
+        try:
+            for obj in objects:
+                status, version = self.index.status(entity_type, obj)
+                if status == UNCHANGED:
+                    counts['skipped'] += 1
+                    continue
+                try:
+                    if status == NEW:
+                        acknowledged = interface.new(obj)
+                    else:
+                        obj.version = version
+                        acknowledged = interface.amend(obj)
+                except Exception as e:
+                    counts['failed'] += 1
+                    counts['errors'].append('%s %s: %s' % (entity_type, getattr(obj, ID_ATTRIBUTES[entity_type]), e))
+                    continue
+                # Record what was sent, with the version AMaaS gave it
+                obj.version = getattr(acknowledged, 'version', None) or obj.version
+                self.index.record(entity_type, [obj], commit=False)
+                counts['created' if status == NEW else 'amended'] += 1
+                uncommitted += 1
+                if uncommitted >= self.commit_every:
+                    self.index.connection.commit()
+                    uncommitted = 0
+        finally:
+            self.index.connection.commit()
+        return counts
+
+
+def create_books(asset_manager_id, asset_manager_party_id, book_ids, broker_ids):
+    books = [Book(asset_manager_id=asset_manager_id, book_id=book_id, party_id=asset_manager_party_id)
+             for book_id in book_ids]
+    books += [Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id)
+              for broker_id in broker_ids]
+    return books
+
+
+def create_equities(asset_manager_id, asset_ids, rng):
+    """ Create equities for use in this example.  The references come from rng, so a re-run creates the same ones. """
+    equities = []
+    for asset_id in asset_ids:
+        references = {'Ticker': Reference(reference_value='%s.%s' % (asset_id, rng.choice(['HK', 'SI', 'N'])))}
+        equities.append(Equity(asset_manager_id=asset_manager_id, asset_id=asset_id, currency=rng.choice(currencies),
+                               references=references))
+    return equities
+
+
+def create_transactions(asset_manager_id, transaction_ids, asset_ids, book_ids, broker_ids, transaction_date, rng):
+    transactions = []
+    for transaction_id in transaction_ids:
+        transactions.append(Transaction(asset_manager_id=asset_manager_id, transaction_id=transaction_id,
+                                        transaction_action=rng.choice(['Buy', 'Sell']),
+                                        asset_book_id=rng.choice(book_ids), counterparty_book_id=rng.choice(broker_ids),
+                                        asset_id=rng.choice(asset_ids), transaction_currency=rng.choice(currencies),
+                                        transaction_date=transaction_date,
+                                        # execution_time defaults to now, which would make every run a change
+                                        execution_time=datetime.combine(transaction_date, time(9, 30)),
+                                        settlement_date=transaction_date + relativedelta(days=2),
+                                        quantity=Decimal(rng.randint(1, 1000)),
+                                        price=Decimal(rng.random()).quantize(Decimal('0.01'))))
+    return transactions
+
+
+def log_counts(entity_type, counts):
+    logging.info("%s - created: %s amended: %s skipped: %s failed: %s", entity_type, counts['created'],
+                 counts['amended'], counts['skipped'], counts['failed'])
+    for error in counts['errors']:
+        logging.error(error)
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    # A fixed asset manager, so that re-running the example reloads the same objects
+    asset_manager_id = 1000001
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    book_ids = ['BOOK' + str(i+1) for i in range(5)]
+    broker_ids = ['BROKER1', 'BROKER2']
+    asset_ids = ['EQ' + str(i+1) for i in range(10)]
+    transaction_ids = [str(i+1) for i in range(100)]
+    trade_date = date(2017, 6, 1)
+    index_filename = os.path.join(tempfile.gettempdir(), 'submission_index.db')
+    index = SubmissionIndex(filename=index_filename)
+    loader = IdempotentLoader(index=index)
+    interfaces = {'party': parties_interface, 'book': books_interface, 'asset': assets_interface,
+                  'transaction': transaction_interface}
+
+    logging.info("--- BUILDING THE OBJECTS ---")
+    rng = random.Random(asset_manager_id)
+    parties = [Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id, base_currency='USD')]
+    parties += [Broker(asset_manager_id=asset_manager_id, party_id=broker_id) for broker_id in broker_ids]
+    books = create_books(asset_manager_id=asset_manager_id, asset_manager_party_id=asset_manager_party_id,
+                         book_ids=book_ids, broker_ids=broker_ids)
+    equities = create_equities(asset_manager_id=asset_manager_id, asset_ids=asset_ids, rng=rng)
+    transactions = create_transactions(asset_manager_id=asset_manager_id, transaction_ids=transaction_ids,
+                                       asset_ids=asset_ids, book_ids=book_ids, broker_ids=broker_ids,
+                                       transaction_date=trade_date, rng=rng)
+    objects = [('party', parties), ('book', books), ('asset', equities), ('transaction', transactions)]
+
+    logging.info("--- LOADING (ONLY WHAT AMAAS DOESN'T ALREADY HAVE) ---")
+    for entity_type, entity_objects in objects:
+        log_counts(entity_type, loader.load(entity_type=entity_type, objects=entity_objects,
+                                            interface=interfaces[entity_type]))
+
+    logging.info("--- RE-LOADING WITH 3 CORRECTED TRANSACTIONS ---")
+    for transaction in transactions[:3]:
+        transaction.quantity += 1
+    log_counts('transaction', loader.load(entity_type='transaction', objects=transactions,
+                                          interface=transaction_interface))
+    index.close()
+
+    logging.info("--- REBUILDING THE INDEX FROM AMAAS AND RE-LOADING ---")
+    os.remove(index_filename)
+    index = SubmissionIndex(filename=index_filename)
+    logging.info("Recorded: %s", index.populate_from_server(asset_manager_id=asset_manager_id, interfaces=interfaces))
+    loader = IdempotentLoader(index=index)
+    for entity_type, entity_objects in objects:
+        log_counts(entity_type, loader.load(entity_type=entity_type, objects=entity_objects,
+                                            interface=interfaces[entity_type]))
+    index.close()
+
+if __name__ == '__main__':
+    main()
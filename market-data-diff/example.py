@@ -0,0 +1,160 @@
+""" An example of persisting only the EOD prices which are new or have changed since the last run. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from business_calendar import Calendar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+import hashlib
+import logging
+import logging.config
+import os
+import random
+import sqlite3
+import tempfile
+
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.market_data.eod_price import EODPrice
+from amaascore.market_data.interface import MarketDataInterface
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+market_data_interface = MarketDataInterface()
+
+
+def price_digest(eod_price):
+    """ A digest of the persisted content of a price.  Decimals are normalised so that 1.50 and 1.5 match. """
+    content = '|'.join([eod_price.price.normalize().to_eng_string(), str(eod_price.active)])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class PriceDigestStore(object):
+    """ A local record of the digest of the last persisted price for each (asset_manager_id, asset_id, date). """
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS eod_price_digests ('
+                                'asset_manager_id INTEGER, asset_id TEXT, business_date TEXT, digest TEXT, '
+                                'PRIMARY KEY (asset_manager_id, asset_id, business_date))')
+        self.connection.commit()
+
+    def digests(self, asset_manager_id, business_date):
+        cursor = self.connection.execute('SELECT asset_id, digest FROM eod_price_digests '
+                                         'WHERE asset_manager_id = ? AND business_date = ?',
+                                         (asset_manager_id, business_date.isoformat()))
+        return dict(cursor.fetchall())
+
+    def update(self, asset_manager_id, business_date, digests):
+        """ Record the digests for prices which have been successfully persisted. """
+        self.connection.executemany('INSERT OR REPLACE INTO eod_price_digests VALUES (?, ?, ?, ?)',
+                                    [(asset_manager_id, asset_id, business_date.isoformat(), digest)
+                                     for asset_id, digest in digests.items()])
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class DiffingPricePersister(object):
+    """
+    Persists EOD prices, skipping any which are unchanged since they were last persisted from this machine.
+
+    The remaining prices are sent in chunks, with several chunks in flight at once.  A digest is only recorded once
+    its chunk has been accepted, so a failed chunk is simply resent on the next run.  Note that the digests only
+    know about prices persisted through this class - a price changed directly in AMaaS will not be resent unless
+    the store is deleted.
+    """
+
+    def __init__(self, market_data_interface, digest_store, chunk_size=500, max_workers=4):
+        self.market_data_interface = market_data_interface
+        self.digest_store = digest_store
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+
+    def persist_eod_prices(self, asset_manager_id, business_date, eod_prices):
+        """
+        :return: A dict with the count of inserted, updated and skipped prices, and the errors for failed chunks
+        """
+        existing = self.digest_store.digests(asset_manager_id=asset_manager_id, business_date=business_date)
+        counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        changes = []
+        for eod_price in eod_prices:
+            digest = price_digest(eod_price)
+            previous = existing.get(eod_price.asset_id)
+            if previous == digest:
+                counts['skipped'] += 1
+            else:
+                changes.append((eod_price, digest, 'inserted' if previous is None else 'updated'))
+        chunks = [changes[i:i + self.chunk_size] for i in range(0, len(changes), self.chunk_size)]
+
+        def persist_chunk(chunk):
+            self.market_data_interface.persist_eod_prices(asset_manager_id=asset_manager_id,
+                                                          business_date=business_date,
+                                                          eod_prices=[eod_price for eod_price, _, _ in chunk],
+                                                          update_existing_prices=True)
+            return chunk
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(persist_chunk, chunk) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    counts['failed'] += len(chunk)
+                    counts['errors'].append(str(e))
+                    continue
+                # sqlite connections should only be used from one thread at a time, so record the digests here
+                self.digest_store.update(asset_manager_id=asset_manager_id, business_date=business_date,
+                                         digests={eod_price.asset_id: digest for eod_price, digest, _ in chunk})
+                for _, _, change in chunk:
+                    counts[change] += 1
+        return counts
+
+
+def generate_prices(asset_manager_id, business_date, asset_ids, previous_prices=None, change_probability=1.0):
+    """ Generate dummy prices, moving each previous price with the given probability. """
+    previous_prices = previous_prices or {}
+    eod_prices = []
+    for asset_id in asset_ids:
+        price = previous_prices.get(asset_id)
+        if price is None:
+            price = Decimal(random.uniform(1, 500)).quantize(Decimal('0.01'))
+        elif random.random() < change_probability:
+            price = (price * Decimal(random.uniform(0.98, 1.02))).quantize(Decimal('0.01'))
+        eod_prices.append(EODPrice(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                   business_date=business_date, price=price))
+    return eod_prices
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    calendar = Calendar()
+    business_date = calendar.addbusdays(date.today(), -2)
+    logging.info("Business Date: %s", business_date)
+    asset_ids = ['EQ' + str(i+1) for i in range(5000)]
+    digest_filename = os.path.join(tempfile.gettempdir(), 'eod_price_digests.db')
+    digest_store = PriceDigestStore(filename=digest_filename)
+    persister = DiffingPricePersister(market_data_interface=market_data_interface, digest_store=digest_store)
+
+    logging.info("--- FIRST RUN: PERSIST ALL PRICES ---")
+    eod_prices = generate_prices(asset_manager_id=asset_manager_id, business_date=business_date,
+                                 asset_ids=asset_ids[:4500])
+    counts = persister.persist_eod_prices(asset_manager_id=asset_manager_id, business_date=business_date,
+                                          eod_prices=eod_prices)
+    logging.info("Inserted: %(inserted)s Updated: %(updated)s Skipped: %(skipped)s Failed: %(failed)s", counts)
+
+    logging.info("--- RE-RUN: 2%% OF PRICES CORRECTED AND 500 NEW ASSETS ---")
+    previous_prices = {eod_price.asset_id: eod_price.price for eod_price in eod_prices}
+    eod_prices = generate_prices(asset_manager_id=asset_manager_id, business_date=business_date,
+                                 asset_ids=asset_ids, previous_prices=previous_prices, change_probability=0.02)
+    counts = persister.persist_eod_prices(asset_manager_id=asset_manager_id, business_date=business_date,
+                                          eod_prices=eod_prices)
+    logging.info("Inserted: %(inserted)s Updated: %(updated)s Skipped: %(skipped)s Failed: %(failed)s", counts)
+    for error in counts['errors']:
+        logging.error(error)
+    digest_store.close()
+
+if __name__ == '__main__':
+    main()
@@ -36,13 +36,13 @@ def main():
     eod_prices = []
     for symbol in symbols:
         share = Share(symbol=symbol)
-        logging.info("Stock Name: %s", share.get_name())
+        logging.info("Stock Name: %s", share.get_name(), extra={'per_row': True})
         close = (share.get_historical(start_date=business_date_str, end_date=business_date_str)[0].get('Close'))
         eod_price = EODPrice(asset_manager_id=asset_manager_id,
                              asset_id=symbol,
                              business_date=business_date,
                              price=Decimal(close))
-        logging.info("EOD Price: %s", eod_price.price)
+        logging.info("EOD Price: %s", eod_price.price, extra={'per_row': True})
         eod_prices.append(eod_price)
 
     logging.info("--- PERSIST PRICES TO AMAAS ---")
@@ -0,0 +1,237 @@
+""" An example of a local, memory-mapped store of EOD prices for fast point, range and cross-sectional reads. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal
+import json
+import logging
+import logging.config
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.market_data.eod_price import EODPrice
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+MANIFEST = 'manifest.json'
+DTYPE = np.dtype('<f8')
+
+
+class EODPriceStore(object):
+    """
+    EOD closes held in one fixed-width column file per asset, indexed by business day ordinal.
+
+    Row n of every column holds the close for the nth business day after the epoch, so a date maps directly to a
+    file offset and no rows are ever parsed.  Missing prices are NaN.  Columns are memory-mapped, so reads come
+    straight from the OS page cache and a date range is returned as a view onto the file rather than a copy.
+
+    Prices are stored as float64 - fine for marking and backtesting, but AMaaS remains the source of truth for the
+    exact Decimal values.
+
+    Each memory map holds a file descriptor, so at most max_open_columns are kept open, least recently used first
+    out.  Cross-sectional reads don't map the columns at all - they read the one value from each file.
+    """
+
+    def __init__(self, path, epoch=date(2000, 1, 3), weekmask='Mon Tue Wed Thu Fri', holidays=(),
+                 growth_days=256, max_open_columns=128):
+        self.path = path
+        self.growth_days = growth_days
+        self.max_open_columns = max_open_columns
+        self._columns = OrderedDict()  # index -> memmap, least recently used first
+        if not os.path.exists(path):
+            os.makedirs(path)
+        manifest_filename = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_filename):
+            with open(manifest_filename) as manifest_file:
+                manifest = json.load(manifest_file)
+        else:
+            manifest = {'epoch': epoch.isoformat(), 'weekmask': weekmask,
+                        'holidays': [holiday.isoformat() for holiday in holidays], 'asset_ids': []}
+        self.epoch = np.datetime64(manifest['epoch'], 'D')
+        self.calendar = np.busdaycalendar(weekmask=manifest['weekmask'], holidays=manifest['holidays'])
+        self._manifest = manifest
+        self.asset_ids = manifest['asset_ids']
+        self._asset_index = {asset_id: index for index, asset_id in enumerate(self.asset_ids)}
+        self._save_manifest()
+
+    def _save_manifest(self):
+        temp_filename = os.path.join(self.path, MANIFEST + '.tmp')
+        with open(temp_filename, 'w') as manifest_file:
+            json.dump(self._manifest, manifest_file)
+        os.replace(temp_filename, os.path.join(self.path, MANIFEST))
+
+    def ordinals(self, business_dates):
+        """ Business day ordinals for an array of dates, raising ValueError for any non-business days. """
+        business_dates = np.asarray(business_dates, dtype='datetime64[D]')
+        if not np.all(np.is_busday(business_dates, busdaycal=self.calendar)) or np.any(business_dates < self.epoch):
+            raise ValueError('Dates must be business days on or after %s' % self.epoch)
+        return np.busday_count(self.epoch, business_dates, busdaycal=self.calendar)
+
+    def dates(self, ordinals):
+        return np.busday_offset(self.epoch, ordinals, busdaycal=self.calendar)
+
+    def _filename(self, index):
+        return os.path.join(self.path, '%d.f8' % index)
+
+    def _column(self, asset_id):
+        """ The memory-mapped column for an asset, or None if there are no prices for it. """
+        index = self._asset_index.get(asset_id)
+        if index is None:
+            return None
+        column = self._columns.pop(index, None)
+        if column is None:
+            column = np.memmap(self._filename(index), dtype=DTYPE, mode='r+')
+            while len(self._columns) >= self.max_open_columns:
+                _, evicted = self._columns.popitem(last=False)
+                evicted.flush()
+        self._columns[index] = column
+        return column
+
+    def _ensure_column(self, asset_id, length):
+        """
+        Create or extend an asset's column file to at least length rows, padding with NaN.  A new asset is only added
+        to the manifest on disk when the caller next saves it.
+        """
+        index = self._asset_index.get(asset_id)
+        if index is None:
+            index = len(self.asset_ids)
+            self.asset_ids.append(asset_id)
+            self._asset_index[asset_id] = index
+            # Clear any column left by a run which stopped before saving the manifest
+            open(self._filename(index), 'wb').close()
+        filename = self._filename(index)
+        current = os.path.getsize(filename) // DTYPE.itemsize if os.path.exists(filename) else 0
+        if current < length:
+            new_length = max(length, current + self.growth_days)
+            column = self._columns.pop(index, None)
+            if column is not None:
+                column.flush()
+                del column
+            with open(filename, 'ab') as column_file:
+                np.full(new_length - current, np.nan, dtype=DTYPE).tofile(column_file)
+        return self._column(asset_id)
+
+    def append(self, eod_prices):
+        """ Write EODPrice objects (e.g. those built in 'market-data-yahoo') into the store, overwriting existing. """
+        by_asset = {}
+        for eod_price in eod_prices:
+            by_asset.setdefault(eod_price.asset_id, []).append(eod_price)
+        no_of_assets = len(self.asset_ids)
+        try:
+            for asset_id, asset_prices in by_asset.items():
+                ordinals = self.ordinals([eod_price.business_date for eod_price in asset_prices])
+                column = self._ensure_column(asset_id, ordinals.max() + 1)
+                column[ordinals] = [float(eod_price.price) for eod_price in asset_prices]
+                column.flush()
+        finally:
+            if len(self.asset_ids) != no_of_assets:
+                self._save_manifest()
+
+    def price(self, asset_id, business_date):
+        """ The close for an asset on a date, or None if there isn't one. """
+        column = self._column(asset_id)
+        ordinal = self.ordinals([business_date])[0]
+        if column is None or ordinal >= len(column) or np.isnan(column[ordinal]):
+            return None
+        return float(column[ordinal])
+
+    def series(self, asset_id, start_date, end_date):
+        """
+        The closes for an asset between two business dates inclusive.
+        :return: A tuple of (dates, prices) arrays.  The prices are a read-only view onto the column file.
+        """
+        start, end = self.ordinals([start_date, end_date])
+        column = self._column(asset_id)
+        dates = self.dates(np.arange(start, end + 1))
+        if column is None:
+            return dates, np.full(len(dates), np.nan)
+        prices = column[start:end + 1]
+        if len(prices) < len(dates):
+            prices = np.concatenate([prices, np.full(len(dates) - len(prices), np.nan)])
+        prices = np.asarray(prices).view()
+        prices.flags.writeable = False
+        return dates, prices
+
+    def cross_section(self, business_date, asset_ids=None):
+        """
+        The closes for many assets on one date.
+        :return: A tuple of (asset_ids, prices array), with NaN for assets that have no price on that date
+        """
+        asset_ids = self.asset_ids if asset_ids is None else list(asset_ids)
+        ordinal = self.ordinals([business_date])[0]
+        prices = np.full(len(asset_ids), np.nan)
+        for column in self._columns.values():
+            column.flush()
+        for i, asset_id in enumerate(asset_ids):
+            index = self._asset_index.get(asset_id)
+            if index is None:
+                continue
+            with open(self._filename(index), 'rb') as column_file:
+                column_file.seek(ordinal * DTYPE.itemsize)
+                value = column_file.read(DTYPE.itemsize)
+            if len(value) == DTYPE.itemsize:
+                prices[i] = np.frombuffer(value, dtype=DTYPE)[0]
+        return asset_ids, prices
+
+    def close(self):
+        for column in self._columns.values():
+            column.flush()
+        self._columns = OrderedDict()
+
+
+def generate_prices(asset_manager_id, asset_ids, business_dates):
+    """ Random walk EOD prices for each asset, as the same EODPrice objects built in 'market-data-yahoo'. """
+    eod_prices = []
+    for asset_id in asset_ids:
+        price = random.uniform(1, 500)
+        for business_date in business_dates:
+            price *= random.uniform(0.98, 1.02)
+            eod_prices.append(EODPrice(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                       business_date=business_date,
+                                       price=Decimal(price).quantize(Decimal('0.01'))))
+    return eod_prices
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    store_path = os.path.join(tempfile.mkdtemp(), 'eod_prices')  # Modify this to keep the store between runs
+    asset_ids = ['EQ' + str(i+1) for i in range(200)]
+    no_of_days = 500
+    store = EODPriceStore(path=store_path)
+    last_ordinal = store.ordinals([np.busday_offset(date.today(), -1, roll='backward', busdaycal=store.calendar)])[0]
+    business_dates = store.dates(np.arange(last_ordinal - no_of_days + 1, last_ordinal + 1)).tolist()
+
+    logging.info("--- GENERATING PRICES ---")
+    eod_prices = generate_prices(asset_manager_id=asset_manager_id, asset_ids=asset_ids,
+                                 business_dates=business_dates)
+
+    logging.info("--- APPENDING %s PRICES TO %s ---", len(eod_prices), store_path)
+    start = time.time()
+    store.append(eod_prices)
+    logging.info("Appended in %.3fs", time.time() - start)
+
+    logging.info("--- POINT LOOKUP ---")
+    logging.info("%s on %s: %s", asset_ids[0], business_dates[-1], store.price(asset_ids[0], business_dates[-1]))
+
+    logging.info("--- DATE RANGE ---")
+    start = time.time()
+    dates, prices = store.series(asset_ids[0], business_dates[-20], business_dates[-1])
+    logging.info("%s closes for %s in %.6fs, last %s", len(prices), asset_ids[0], time.time() - start, prices[-1])
+
+    logging.info("--- CROSS SECTION ---")
+    start = time.time()
+    _, prices = store.cross_section(business_dates[-1])
+    logging.info("%s closes on %s in %.6fs, mean %.2f", len(prices), business_dates[-1], time.time() - start,
+                 np.nanmean(prices))
+    store.close()
+
+if __name__ == '__main__':
+    main()
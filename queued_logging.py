@@ -0,0 +1,202 @@
+""" A low-overhead logging mode for high-volume loads: queued output, sampled per-row messages and progress lines. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import atexit
+import logging
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+# Pass as extra= to mark a per-row message from an example as one to sample, e.g. for a line logged per position
+PER_ROW = {'per_row': True}
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Puts records on a queue for a background thread to format and write with the original handlers.
+
+    Records are queued as they are - the message is only formatted on the background thread.  This means an
+    argument which is changed straight after the logging call may be logged with its new value.
+
+    The background thread only exists in the process which created the handler, so in a forked child process (e.g. a
+    multiprocessing worker) records go straight to the original handlers instead.
+    """
+
+    def __init__(self, record_queue, handlers):
+        super(QueuedHandler, self).__init__()
+        self.record_queue = record_queue
+        self.handlers = handlers
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            self.record_queue.put_nowait((self.handlers, record))
+        else:
+            write_record(self.handlers, record)
+
+
+def write_record(handlers, record):
+    for handler in handlers:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through the first of every n INFO (and below) records from each logging call, and at most max_per_second.
+
+    Warnings and errors are always let through.  Only records from loggers under one of the given names - e.g.
+    'amaascore' for the per-object messages the SDK interfaces log - or marked with extra=PER_ROW are sampled.  If a
+    ProgressLogger is given, every sampled record - dropped or not - is counted with it.
+    """
+
+    def __init__(self, names=('amaascore',), every=100, max_per_second=None, progress=None):
+        super(SamplingFilter, self).__init__()
+        self.names = tuple(names)
+        self.every = every
+        self.max_per_second = max_per_second
+        self.progress = progress
+        self._prefixes = tuple(name + '.' for name in self.names)
+        self._counts = {}
+        self._second = None
+        self._this_second = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        # A record which propagates to several queued handlers is only sampled once
+        sampled = getattr(record, 'sampled', None)
+        if sampled is None:
+            sampled = record.sampled = self._sample(record)
+        return sampled
+
+    def _sample(self, record):
+        if record.levelno >= logging.WARNING or not (getattr(record, 'per_row', False) or record.name in self.names or
+                                                     record.name.startswith(self._prefixes)):
+            return True
+        if self.progress is not None:
+            self.progress.update()
+        call = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(call, 0)
+            self._counts[call] = count + 1
+            if count % self.every:
+                return False
+            if self.max_per_second:
+                second = int(record.created)
+                if second != self._second:
+                    self._second, self._this_second = second, 0
+                self._this_second += 1
+                if self._this_second > self.max_per_second:
+                    return False
+        if self.every > 1:
+            record.msg = '%s [1 in %s sampled]' % (record.msg, self.every)
+        return True
+
+
+class QueuedLogging(object):
+    """
+    Moves the formatting and writing of every configured handler onto a single background thread.
+
+    Call start() after the usual logging configuration (e.g. dictConfig(DEFAULT_LOGGING)).  The handlers of the root
+    logger and of any named loggers are swapped for QueuedHandlers, with a SamplingFilter in front so that dropped
+    records are never queued.  stop() - also registered to run at exit - drains the queue and puts the original
+    handlers back.
+
+    With a progress_interval, an aggregated line counting the sampled messages is also logged that often.
+    """
+
+    def __init__(self, sample_names=('amaascore',), sample_every=100, max_per_second=None, progress_interval=None):
+        progress = ProgressLogger('Sampled messages', interval=progress_interval) if progress_interval else None
+        self.sampling_filter = SamplingFilter(names=sample_names, every=sample_every, max_per_second=max_per_second,
+                                              progress=progress)
+        self.record_queue = queue.Queue()
+        self._original_handlers = {}
+        self._thread = None
+        self._thread_pid = None
+
+    def start(self):
+        loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                                           if isinstance(logger, logging.Logger) and logger.handlers]
+        for logger in loggers:
+            self._original_handlers[logger] = logger.handlers[:]
+            handlers = logger.handlers[:] or [self._default_handler()]
+            handler = QueuedHandler(record_queue=self.record_queue, handlers=handlers)
+            handler.addFilter(self.sampling_filter)
+            logger.handlers = [handler]
+        self._thread = threading.Thread(target=self._write, name='queued-logging')
+        self._thread.daemon = True
+        self._thread.start()
+        self._thread_pid = os.getpid()
+        atexit.register(self.stop)
+        return self
+
+    @staticmethod
+    def _default_handler():
+        """
+        The handler basicConfig() would add to a root logger without handlers on its first message - which can no
+        longer happen once the root logger has a QueuedHandler.
+        """
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        return handler
+
+    def stop(self):
+        if self._thread is None or os.getpid() != self._thread_pid:
+            return
+        progress = self.sampling_filter.progress
+        if progress is not None and progress.count:
+            progress.finish()
+        self.record_queue.put(None)
+        self._thread.join()
+        self._thread = None
+        for logger, handlers in self._original_handlers.items():
+            logger.handlers = handlers
+        self._original_handlers = {}
+
+    def _write(self):
+        while True:
+            item = self.record_queue.get()
+            if item is None:
+                return
+            write_record(*item)
+
+
+class ProgressLogger(object):
+    """
+    Logs one aggregated progress line (count, rate and ETA) at most every interval seconds, instead of one line per
+    row.  update() only counts and checks the clock, so it is cheap enough to call for every row.
+    """
+
+    def __init__(self, description, total=None, interval=5.0, logger=None):
+        self.description = description
+        self.total = total
+        self.interval = interval
+        self.logger = logger or logging.getLogger()  # dictConfig disables loggers created before it is called
+        self.count = 0
+        self.start_time = time.time()
+        self._next_log = self.start_time + interval
+
+    def update(self, n=1):
+        self.count += n
+        now = time.time()
+        if now >= self._next_log:
+            self._log(now)
+            self._next_log = now + self.interval
+
+    def finish(self):
+        self._log(time.time())
+
+    def _log(self, now):
+        elapsed = now - self.start_time
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            eta = (self.total - self.count) / rate if rate else float('inf')
+            self.logger.info('%s: %s/%s (%.1f%%) %.1f rows/sec ETA %.0fs', self.description, self.count, self.total,
+                             100.0 * self.count / self.total, rate, eta)
+        else:
+            self.logger.info('%s: %s %.1f rows/sec', self.description, self.count, rate)
@@ -0,0 +1,208 @@
+""" Run any of the examples, with optional profiling broken down by the stages each example logs. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import cProfile
+import json
+import logging
+import logging.config
+import os
+import pstats
+import re
+import runpy
+import sys
+import time
+import tracemalloc
+
+from queued_logging import QueuedLogging
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STAGE_PATTERN = re.compile(r'^--- (.+) ---$')
+
+
+def list_examples():
+    return sorted(name for name in os.listdir(ROOT) if os.path.isfile(os.path.join(ROOT, name, 'example.py')))
+
+
+def top_functions(profiler, limit):
+    """ The functions with the most cumulative time, with their self time and call counts. """
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, function), (_, calls, self_time, cumulative_time, _) in stats.stats.items():
+        rows.append({'function': '%s:%s(%s)' % (filename, line, function),
+                     'calls': calls,
+                     'self_seconds': self_time,
+                     'cumulative_seconds': cumulative_time})
+    rows.sort(key=lambda row: row['cumulative_seconds'], reverse=True)
+    return rows[:limit]
+
+
+def top_allocations(snapshot, previous_snapshot, limit):
+    """ The source lines which allocated the most memory during a stage (and haven't released it). """
+    if previous_snapshot is None:
+        statistics = snapshot.statistics('lineno')
+        return [{'location': str(statistic.traceback), 'size_bytes': statistic.size, 'count': statistic.count}
+                for statistic in statistics[:limit]]
+    statistics = snapshot.compare_to(previous_snapshot, 'lineno')
+    return [{'location': str(statistic.traceback), 'size_bytes': statistic.size_diff,
+             'count': statistic.count_diff} for statistic in statistics[:limit]]
+
+
+class StageRecorder(object):
+    """
+    Splits a run into stages at each '--- STAGE NAME ---' log message, timing each stage and optionally profiling it.
+
+    Stage markers are picked up with a log record factory rather than a handler, since the examples replace the
+    logging handlers with dictConfig/basicConfig when they are imported.
+    """
+
+    def __init__(self, profile=False, trace_memory=False, limit=20, pstats_dir=None):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.limit = limit
+        self.pstats_dir = pstats_dir
+        self.stages = []
+        self._current = None
+        self._profiler = None
+        self._snapshot = None
+        self._record_factory = logging.getLogRecordFactory()
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        logging.setLogRecordFactory(self._create_record)
+        self._begin('(startup)')
+
+    def stop(self):
+        self._end()
+        logging.setLogRecordFactory(self._record_factory)
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def _create_record(self, *args, **kwargs):
+        record = self._record_factory(*args, **kwargs)
+        # Only format the possible stage markers - formatting every message would undo --queued-logging's sampling
+        if not (isinstance(record.msg, str) and record.msg.startswith('--- ')):
+            return record
+        match = STAGE_PATTERN.match(record.getMessage())
+        if match:
+            self._end()
+            self._begin(match.group(1))
+        return record
+
+    def _begin(self, name):
+        self._current = {'stage': name, 'wall': time.time(), 'cpu': time.process_time()}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _end(self):
+        if self._current is None:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+        stage = self._current
+        wall_seconds = time.time() - stage.pop('wall')
+        cpu_seconds = time.process_time() - stage.pop('cpu')
+        # Time off the CPU is mostly spent waiting on the network
+        stage.update({'wall_seconds': wall_seconds, 'cpu_seconds': cpu_seconds,
+                      'wait_seconds': max(0.0, wall_seconds - cpu_seconds)})
+        if self._profiler is not None:
+            stage['top_functions'] = top_functions(self._profiler, self.limit)
+            if self.pstats_dir:
+                filename = os.path.join(self.pstats_dir, '%02d-%s.prof' % (len(self.stages),
+                                                                          re.sub(r'\W+', '-', stage['stage'])))
+                self._profiler.dump_stats(filename)
+                stage['pstats_file'] = filename
+            self._profiler = None
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            stage.update({'memory_current_bytes': current, 'memory_peak_bytes': peak,
+                          'top_allocations': top_allocations(snapshot, self._snapshot, self.limit)})
+            self._snapshot = snapshot
+        self.stages.append(stage)
+        self._current = None
+
+
+def queue_logging_after_configuration(queued_logging):
+    """ Switch to queued logging whenever the example configures logging, which it does when it is imported. """
+    def wrap(configure):
+        def configure_then_queue(*args, **kwargs):
+            queued_logging.stop()
+            configure(*args, **kwargs)
+            queued_logging.start()
+        return configure_then_queue
+    logging.config.dictConfig = wrap(logging.config.dictConfig)
+    logging.basicConfig = wrap(logging.basicConfig)
+
+
+def run_example(name, args):
+    """ Run an example's example.py as __main__, as if it had been run from the command line. """
+    example_dir = os.path.join(ROOT, name)
+    path = os.path.join(example_dir, 'example.py')
+    sys.path.insert(0, example_dir)
+    sys.argv = [path] + list(args)
+    runpy.run_path(path, run_name='__main__')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('example', nargs='?', help='The example to run, e.g. populate-dummy')
+    parser.add_argument('example_args', nargs=argparse.REMAINDER, help='Arguments passed on to the example')
+    parser.add_argument('--list', action='store_true', help='List the available examples')
+    parser.add_argument('--profile', action='store_true', help='Profile each stage with cProfile')
+    parser.add_argument('--pstats-dir', help='Also write the cProfile stats for each stage to this directory')
+    parser.add_argument('--tracemalloc', action='store_true', help='Record the top allocations in each stage')
+    parser.add_argument('--top', type=int, default=20, help='How many functions/allocations to report per stage')
+    parser.add_argument('--queued-logging', action='store_true',
+                        help='Format and write log messages on a background thread, sampling per-object messages')
+    parser.add_argument('--log-sample-every', type=int, default=100,
+                        help='With --queued-logging, log 1 in this many per-object messages from the SDK')
+    parser.add_argument('--log-max-per-second', type=int,
+                        help='With --queued-logging, the most per-object messages from the SDK to log each second')
+    parser.add_argument('--log-progress-interval', type=float, default=5.0,
+                        help='With --queued-logging, how often to log the count and rate of per-object messages')
+    parser.add_argument('--output', help='Where to write the JSON results (default: <example>-profile.json)')
+    options = parser.parse_args()
+
+    examples = list_examples()
+    if options.list or not options.example:
+        print('\n'.join(examples))
+        return
+    if options.example not in examples:
+        parser.error('Unknown example %s - choose from: %s' % (options.example, ', '.join(examples)))
+    if options.pstats_dir and not os.path.exists(options.pstats_dir):
+        os.makedirs(options.pstats_dir)
+
+    recorder = StageRecorder(profile=options.profile or bool(options.pstats_dir), trace_memory=options.tracemalloc,
+                             limit=options.top, pstats_dir=options.pstats_dir)
+    queued_logging = None
+    if options.queued_logging:
+        queued_logging = QueuedLogging(sample_every=options.log_sample_every, max_per_second=options.log_max_per_second,
+                                       progress_interval=options.log_progress_interval)
+    if queued_logging:
+        queue_logging_after_configuration(queued_logging)
+    results = {'example': options.example, 'args': options.example_args, 'error': None}
+    start = time.time()
+    recorder.start()
+    try:
+        run_example(options.example, options.example_args)
+    except BaseException as e:
+        results['error'] = repr(e)
+        raise
+    finally:
+        if queued_logging:
+            queued_logging.stop()
+        recorder.stop()
+        results['wall_seconds'] = time.time() - start
+        results['stages'] = recorder.stages
+        output = options.output or '%s-profile.json' % options.example
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Results written to %s' % output, file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
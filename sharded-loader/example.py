@@ -0,0 +1,219 @@
+""" An example of loading a large transactions CSV file across several processes, sharded by book. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from amaasutils.random_utils import random_string
+import csv
+import io
+import logging
+import logging.config
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.tools.csv_tools import csv_stream_to_objects, objects_to_csv
+from amaascore.tools.generate_transaction import generate_transaction
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+from amaascore.transactions.utils import json_to_transaction
+
+# queued_logging is shared by the examples, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from queued_logging import ProgressLogger
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = None  # Each worker process creates its own - see init_worker
+currencies = ['HKD', 'SGD', 'USD']
+
+
+def shard_for_book(book_id, no_of_shards):
+    """ A hash of the book which is stable across processes (unlike the builtin hash). """
+    return zlib.crc32(book_id.encode('utf-8')) % no_of_shards
+
+
+def iter_records(f):
+    """
+    Yield (offset, length, record) for each CSV record in a binary file.
+
+    A record can span several physical lines if a quoted field contains a newline, so lines are joined until the
+    number of quote characters is even.
+    """
+    offset = f.tell()
+    pending = b''
+    for line in iter(f.readline, b''):
+        pending += line
+        if pending.count(b'"') % 2 == 0:
+            yield offset, len(pending), pending
+            offset += len(pending)
+            pending = b''
+    if pending:
+        yield offset, len(pending), pending
+
+
+def plan_shards(filename, no_of_shards, key='asset_book_id'):
+    """
+    Scan the file once, assigning each record to a shard by the hash of its book.
+
+    Only the byte ranges are kept - adjacent records in the same shard are merged into a single range - so the
+    workers read and parse their own rows and the parent never builds a Transaction.  Because the ranges are kept in
+    file order, trades within a book are loaded in the order they appear in the file.
+    :return: The header line, and a list of byte ranges [(offset, length), ...] for each shard
+    """
+    shards = [[] for _ in range(no_of_shards)]
+    with open(filename, 'rb') as f:
+        header = f.readline()
+        key_index = next(csv.reader([header.decode('utf-8')])).index(key)
+        previous_shard = None
+        for offset, length, record in iter_records(f):
+            book_id = next(csv.reader([record.decode('utf-8')]))[key_index]
+            shard = shard_for_book(book_id, no_of_shards)
+            if shard == previous_shard:
+                last_offset, last_length = shards[shard][-1]
+                shards[shard][-1] = (last_offset, last_length + length)
+            else:
+                shards[shard].append((offset, length))
+            previous_shard = shard
+    return header, shards
+
+
+def init_worker():
+    """ Interfaces hold an HTTP session, which must not be shared with the parent process. """
+    global transaction_interface
+    transaction_interface = TransactionsInterface()
+
+
+def load_shard(args):
+    """ Parse and submit one shard's transactions in file order, returning a summary for the report. """
+    shard, filename, header, ranges, progress_interval = args
+    start = time.time()
+    with open(filename, 'rb') as f:
+        chunks = [header]
+        for offset, length in ranges:
+            f.seek(offset)
+            chunks.append(f.read(length))
+    stream = io.StringIO(b''.join(chunks).decode('utf-8'))
+    transactions = csv_stream_to_objects(stream=stream, json_handler=json_to_transaction)
+    parsed = time.time()
+    submitted = 0
+    errors = []
+    progress = ProgressLogger('Shard %s' % shard, total=len(transactions), interval=progress_interval)
+    for transaction in transactions:
+        try:
+            transaction_interface.new(transaction)
+            submitted += 1
+        except Exception as e:
+            errors.append((transaction.transaction_id, str(e)))
+        progress.update()
+    return {'shard': shard,
+            'pid': os.getpid(),
+            'books': sorted(set(transaction.asset_book_id for transaction in transactions)),
+            'rows': len(transactions),
+            'submitted': submitted,
+            'failed': len(errors),
+            'errors': errors,
+            'parse_seconds': parsed - start,
+            'submit_seconds': time.time() - parsed}
+
+
+def load_transactions(filename, no_of_processes, progress_interval=5.0):
+    """
+    Load the transactions file across a pool of processes and merge the per-shard results into one report.  Each
+    shard logs its progress (rows/sec and ETA) every progress_interval seconds.
+    """
+    header, shards = plan_shards(filename, no_of_processes)
+    tasks = [(shard, filename, header, ranges, progress_interval) for shard, ranges in enumerate(shards) if ranges]
+    start = time.time()
+    results = []
+    pool = multiprocessing.Pool(processes=no_of_processes, initializer=init_worker)
+    try:
+        for result in pool.imap_unordered(load_shard, tasks):
+            logging.info("Shard %s complete: %s rows, %s submitted, %s failed (books: %s)", result['shard'],
+                         result['rows'], result['submitted'], result['failed'], ', '.join(result['books']))
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    results.sort(key=lambda result: result['shard'])
+    return {'shards': results,
+            'rows': sum(result['rows'] for result in results),
+            'submitted': sum(result['submitted'] for result in results),
+            'failed': sum(result['failed'] for result in results),
+            'errors': [error for result in results for error in result['errors']],
+            'elapsed_seconds': time.time() - start}
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    brokers = ['BROKER1', 'BROKER2']
+    csv_path = tempfile.gettempdir()  # Modify this to read and write from a different directory
+    no_of_processes = multiprocessing.cpu_count()
+    no_of_books = 20
+    no_of_equities = 50
+    no_of_transactions = 10000
+    currency = 'USD'
+
+    logging.info("--- SETTING UP PARTIES ---")
+    parties_interface.new(Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id,
+                                  base_currency=currency))
+    for broker_id in brokers:
+        parties_interface.new(Broker(asset_manager_id=asset_manager_id, party_id=broker_id))
+
+    logging.info("--- SETTING UP BOOKS ---")
+    asset_book_ids = ['BOOK' + str(i+1) for i in range(no_of_books)]
+    for book_id in asset_book_ids:
+        books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=book_id, party_id=asset_manager_party_id))
+    for broker_id in brokers:
+        books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id))
+
+    logging.info("--- SETTING UP EQUITIES ---")
+    asset_ids = ['EQ' + str(i+1) for i in range(no_of_equities)]
+    for asset_id in asset_ids:
+        references = {'ISIN': Reference(reference_value=random_string(12)),
+                      'Ticker': Reference(reference_value=random_string(8))}
+        assets_interface.new(Equity(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                    currency=random.choice(currencies), references=references))
+
+    logging.info("--- CREATING TRANSACTIONS CSV FILE ---")
+    transactions = []
+    for i in range(no_of_transactions):
+        transaction = generate_transaction(asset_manager_id=asset_manager_id, transaction_id=str(i+1),
+                                           asset_id=random.choice(asset_ids),
+                                           asset_book_id=random.choice(asset_book_ids),
+                                           counterparty_book_id=random.choice(brokers))
+        transactions.append(transaction)
+    transactions_filename = os.path.join(csv_path, 'transactions.csv')
+    logging.info("--- WRITING TO %s ---", transactions_filename)
+    objects_to_csv(objects=transactions, clazz=Transaction, filename=transactions_filename)
+
+    logging.info("--- LOADING TRANSACTIONS ACROSS %s PROCESSES ---", no_of_processes)
+    report = load_transactions(filename=transactions_filename, no_of_processes=no_of_processes)
+    logging.info("Loaded %s/%s transactions in %.1fs (%s failed)", report['submitted'], report['rows'],
+                 report['elapsed_seconds'], report['failed'])
+    for shard in report['shards']:
+        logging.info("Shard %s (pid %s): %s rows - parse %.2fs, submit %.2fs", shard['shard'], shard['pid'],
+                     shard['rows'], shard['parse_seconds'], shard['submit_seconds'])
+    for transaction_id, error in report['errors']:
+        logging.error("Transaction %s failed: %s", transaction_id, error)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+""" An example of replaying a day of trades and measuring how long each takes to show up in the positions. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import csv
+from datetime import date, datetime, time as datetime_time, timedelta
+from dateutil.parser import parse
+from decimal import Decimal
+import logging
+import logging.config
+import random
+import threading
+import time
+
+from amaascore.assets.equity import Equity
+from amaascore.assets.interface import AssetsInterface
+from amaascore.books.book import Book
+from amaascore.books.interface import BooksInterface
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.core.reference import Reference
+from amaascore.parties.broker import Broker
+from amaascore.parties.company import Company
+from amaascore.parties.interface import PartiesInterface
+from amaascore.transactions.interface import TransactionsInterface
+from amaascore.transactions.transaction import Transaction
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+# Create the interfaces
+assets_interface = AssetsInterface()
+books_interface = BooksInterface()
+parties_interface = PartiesInterface()
+transaction_interface = TransactionsInterface()
+
+TRADE_FIELDS = ['timestamp', 'book_id', 'asset_id', 'transaction_action', 'quantity', 'price']
+
+
+def generate_trades(trade_date, book_ids, asset_ids, no_of_trades, open_time=datetime_time(9, 30),
+                    close_time=datetime_time(16, 0)):
+    """ Generate a day of random trades, spread over the trading session. """
+    session_open = datetime.combine(trade_date, open_time)
+    session_seconds = (datetime.combine(trade_date, close_time) - session_open).total_seconds()
+    trades = []
+    for _ in range(no_of_trades):
+        trades.append({'timestamp': session_open + timedelta(seconds=random.uniform(0, session_seconds)),
+                       'book_id': random.choice(book_ids),
+                       'asset_id': random.choice(asset_ids),
+                       'transaction_action': random.choice(['Buy', 'Sell']),
+                       'quantity': Decimal(random.randint(1, 100) * 100),
+                       'price': Decimal(random.uniform(10, 100)).quantize(Decimal('0.01'))})
+    return trades
+
+
+def write_trades(trades, filename):
+    with open(filename, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=TRADE_FIELDS)
+        writer.writeheader()
+        for trade in trades:
+            writer.writerow(dict(trade, timestamp=trade['timestamp'].isoformat()))
+
+
+def read_trades(filename):
+    """ Read a recorded day of trades, with the columns in TRADE_FIELDS. """
+    with open(filename, 'r') as f:
+        return [dict(row, timestamp=parse(row['timestamp']), quantity=Decimal(row['quantity']),
+                     price=Decimal(row['price'])) for row in csv.DictReader(f)]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class ReplayEngine(object):
+    """
+    Replays trades in timestamp order and measures the latency until each one is reflected in position_search.
+
+    A background thread polls the positions of every (book, asset) with trades outstanding.  A trade counts as
+    visible once the position quantity has changed since the last confirmed trade, and matches the expected
+    cumulative quantity after that trade.  The measured latency includes up to one poll interval.  Positions start
+    from zero, so replay into a fresh asset manager or books.
+
+    Quantity alone can be ambiguous - e.g. a Buy and an equal Sell leave the position where it was.  The matching is
+    conservative: a position which hasn't changed confirms nothing, and when several pending trades would match, only
+    the earliest is confirmed.  Trades which are never confirmed this way are reported as not visible, rather than
+    being marked visible too early.
+    """
+
+    def __init__(self, asset_manager_id, counterparty_book_id, asset_currencies, speed=1.0, poll_interval=0.25,
+                 visibility_timeout=60.0):
+        """
+        :param asset_currencies: A dict of asset_id -> currency
+        :param speed: 1.0 replays in real time, 60.0 at 60x, and None as fast as possible
+        """
+        self.asset_manager_id = asset_manager_id
+        self.counterparty_book_id = counterparty_book_id
+        self.asset_currencies = asset_currencies
+        self.speed = speed
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.position_interface = TransactionsInterface()  # Polling has its own session
+        self.records = []
+        self._expected = {}  # (book_id, asset_id) -> cumulative quantity
+        self._pending = {}  # (book_id, asset_id) -> [record, ...] not yet visible, in booking order
+        self._confirmed = {}  # (book_id, asset_id) -> position quantity when a trade was last confirmed
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self, trades):
+        trades = sorted(trades, key=lambda trade: trade['timestamp'])
+        poller = threading.Thread(target=self._poll)
+        poller.daemon = True
+        poller.start()
+        replay_start = time.time()
+        first_timestamp = trades[0]['timestamp'] if trades else None
+        for i, trade in enumerate(trades):
+            if self.speed:
+                due = replay_start + (trade['timestamp'] - first_timestamp).total_seconds() / self.speed
+                time.sleep(max(0, due - time.time()))
+            self._book(transaction_id='REPLAY' + str(i + 1), trade=trade)
+        deadline = time.time() + self.visibility_timeout
+        while time.time() < deadline and any(self._pending.values()):
+            time.sleep(self.poll_interval)
+        self._stopped.set()
+        poller.join()
+        return self.report(replay_start)
+
+    def _book(self, transaction_id, trade):
+        transaction = Transaction(asset_manager_id=self.asset_manager_id,
+                                  transaction_id=transaction_id,
+                                  transaction_action=trade['transaction_action'],
+                                  asset_book_id=trade['book_id'],
+                                  counterparty_book_id=self.counterparty_book_id,
+                                  asset_id=trade['asset_id'],
+                                  transaction_currency=self.asset_currencies[trade['asset_id']],
+                                  transaction_date=trade['timestamp'].date(),
+                                  settlement_date=trade['timestamp'].date() + timedelta(days=2),
+                                  quantity=trade['quantity'],
+                                  price=trade['price'])
+        key = (trade['book_id'], trade['asset_id'])
+        signed_quantity = trade['quantity'] if trade['transaction_action'] == 'Buy' else -trade['quantity']
+        record = {'transaction_id': transaction_id, 'submitted': time.time(), 'acknowledged': None, 'visible': None}
+        with self._lock:
+            self._expected[key] = self._expected.get(key, Decimal(0)) + signed_quantity
+            record['expected_quantity'] = self._expected[key]
+            self.records.append(record)
+            self._pending.setdefault(key, []).append(record)
+        try:
+            transaction_interface.new(transaction)
+            record['acknowledged'] = time.time()
+        except Exception as e:
+            logging.error("Failed to book %s: %s", transaction_id, e)
+            record['error'] = str(e)
+            with self._lock:
+                self._expected[key] -= signed_quantity
+                self._pending[key].remove(record)
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                pending_keys = [key for key, records in self._pending.items() if records]
+            asset_ids_by_book = {}
+            for book_id, asset_id in pending_keys:
+                asset_ids_by_book.setdefault(book_id, []).append(asset_id)
+            for book_id, asset_ids in asset_ids_by_book.items():
+                try:
+                    positions = self.position_interface.position_search(asset_manager_ids=[self.asset_manager_id],
+                                                                        book_ids=[book_id], asset_ids=asset_ids,
+                                                                        accounting_types=['Transaction Date'])
+                except Exception as e:
+                    logging.warning("Failed to poll the positions for %s: %s", book_id, e)
+                    continue
+                seen = time.time()
+                quantities = {position.asset_id: position.quantity for position in positions}
+                for asset_id in asset_ids:
+                    # Flat positions may not be returned at all
+                    self._mark_visible((book_id, asset_id), quantities.get(asset_id, Decimal(0)), seen)
+            self._stopped.wait(self.poll_interval)
+
+    def _mark_visible(self, key, quantity, seen):
+        """ Confirm everything up to the earliest pending trade whose expected quantity matches a changed position. """
+        with self._lock:
+            if quantity == self._confirmed.get(key, Decimal(0)):
+                return
+            records = self._pending.get(key, [])
+            for i, record in enumerate(records):
+                if record['expected_quantity'] == quantity:
+                    if not record['acknowledged']:
+                        return  # Confirm it on a later poll, once the booking has returned
+                    for visible_record in records[:i + 1]:
+                        visible_record['visible'] = seen
+                    del records[:i + 1]
+                    self._confirmed[key] = quantity
+                    return
+
+    def report(self, replay_start):
+        """ Latency percentiles, and a per second timeline of trades booked and trades visible. """
+        acknowledged = sorted(r['acknowledged'] - r['submitted'] for r in self.records if r['acknowledged'])
+        visible = sorted(r['visible'] - r['submitted'] for r in self.records if r['visible'])
+        timeline = {}
+        for record in self.records:
+            for event in ('submitted', 'visible'):
+                if record[event]:
+                    second = int(record[event] - replay_start)
+                    timeline.setdefault(second, {'submitted': 0, 'visible': 0})[event] += 1
+        summary = {}
+        for name, latencies in (('booking', acknowledged), ('visibility', visible)):
+            summary[name] = {'count': len(latencies),
+                             'p50': percentile(latencies, 0.5),
+                             'p90': percentile(latencies, 0.9),
+                             'p99': percentile(latencies, 0.99),
+                             'max': latencies[-1] if latencies else None}
+        return {'trades': len(self.records),
+                'failed': sum(1 for record in self.records if 'error' in record),
+                'not_visible': sum(1 for record in self.records if not record['visible'] and 'error' not in record),
+                'latency': summary,
+                'timeline': [dict(second=second, **counts) for second, counts in sorted(timeline.items())]}
+
+
+def create_assets(asset_manager_id, symbols):
+    assets = []
+    for symbol in symbols:
+        references = {'Ticker': Reference(reference_value=symbol)}
+        asset = Equity(asset_manager_id=asset_manager_id, asset_id=symbol, currency='HKD', references=references)
+        assets_interface.new(asset)
+        assets.append(asset)
+    return assets
+
+
+def main():
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    asset_manager_party_id = 'AMID' + str(asset_manager_id)
+    broker_id = 'BROKER'
+    currency = 'USD'
+    trades_filename = None  # Set this to the path of a recorded day of trades to replay that instead
+    no_of_trades = 500
+    speed = 60.0  # 1.0 replays in real time, and None as fast as possible
+
+    logging.info("--- LOADING TRADES ---")
+    if trades_filename:
+        trades = read_trades(trades_filename)
+    else:
+        trades = generate_trades(trade_date=date.today(), book_ids=['DEMO-BOOK1', 'DEMO-BOOK2', 'DEMO-BOOK3'],
+                                 asset_ids=['0005.HK', '0700.HK', '0941.HK', '1299.HK', '0388.HK'],
+                                 no_of_trades=no_of_trades)
+    # The books and assets are whichever ones the trades use
+    book_ids = sorted(set(trade['book_id'] for trade in trades))
+    symbols = sorted(set(trade['asset_id'] for trade in trades))
+
+    logging.info("--- SETTING UP BOOKS ---")
+    for book_id in book_ids:
+        books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=book_id, party_id=asset_manager_party_id))
+    books_interface.new(Book(asset_manager_id=asset_manager_id, book_id=broker_id, party_id=broker_id))
+
+    logging.info("--- SETTING UP PARTIES ---")
+    parties_interface.new(Company(asset_manager_id=asset_manager_id, party_id=asset_manager_party_id,
+                                  base_currency=currency))
+    parties_interface.new(Broker(asset_manager_id=asset_manager_id, party_id=broker_id))
+
+    logging.info("--- SETTING UP ASSETS ---")
+    assets = create_assets(asset_manager_id=asset_manager_id, symbols=symbols)
+
+    logging.info("--- REPLAYING TRADES ---")
+    logging.info("Replaying %s trades at %s", len(trades), '%sx speed' % speed if speed else 'maximum speed')
+    engine = ReplayEngine(asset_manager_id=asset_manager_id, counterparty_book_id=broker_id,
+                          asset_currencies={asset.asset_id: asset.currency for asset in assets}, speed=speed)
+    report = engine.run(trades)
+
+    logging.info("--- RESULTS ---")
+    logging.info("Trades: %(trades)s Failed: %(failed)s Not visible: %(not_visible)s", report)
+    for name, latency in sorted(report['latency'].items()):
+        logging.info("%s latency (s) - count: %s p50: %s p90: %s p99: %s max: %s", name, latency['count'],
+                     latency['p50'], latency['p90'], latency['p99'], latency['max'])
+    for bucket in report['timeline']:
+        logging.info("t+%(second)ss: %(submitted)s booked, %(visible)s visible", bucket)
+
+if __name__ == '__main__':
+    main()
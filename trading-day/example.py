@@ -119,7 +119,7 @@ def main():
                                                       book_ids=[trading_book.book_id],
                                                       accounting_types=['Transaction Date'])
     for position in positions:
-        logging.info(' | '.join([position.book_id, str(position.quantity), position.asset_id]))
+        logging.info('%s | %s | %s', position.book_id, position.quantity, position.asset_id, extra={'per_row': True})
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,296 @@
+""" An example of valuing positions against EOD prices and FX rates, with vectorized mark-to-market and P&L. """
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+from datetime import date
+from decimal import Decimal
+import logging
+import logging.config
+import random
+import time
+
+import numpy as np
+
+from amaascore.config import DEFAULT_LOGGING
+from amaascore.market_data.eod_price import EODPrice
+from dateutil.relativedelta import relativedelta
+
+logging.config.dictConfig(DEFAULT_LOGGING)
+
+
+class Interner(object):
+    """ Maps identifiers (asset_ids, book_ids, currencies) to dense integer indices, adding new ones as seen. """
+
+    def __init__(self):
+        self.index = {}
+        self.keys = []
+
+    def intern(self, keys):
+        index = self.index
+        indices = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            position = index.get(key)
+            if position is None:
+                position = index[key] = len(self.keys)
+                self.keys.append(key)
+            indices[i] = position
+        return indices
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def grow(array, length, fill):
+    """ Extend a 1-d array to length, filling the new entries. """
+    if len(array) >= length:
+        return array
+    return np.concatenate([array, np.full(length - len(array), fill, dtype=array.dtype)])
+
+
+class ValuationEngine(object):
+    """
+    Values positions in the base currency of the asset manager (e.g. the Company base_currency).
+
+    Positions, assets, books and currencies are interned to integer indices, so a revaluation is a handful of array
+    gathers and multiplies, with aggregation by book and currency done by np.bincount.
+
+    - market value = quantity * price * fx
+    - P&L = quantity * (price * fx - previous price * previous fx)
+
+    The P&L is the day-over-day revaluation of the current holding - it does not include P&L from trading during
+    the day.  FX rates are the value of one unit of the currency in the base currency.  Positions with a missing
+    price or FX rate are left out of the totals and counted as unpriced, rather than silently valued at zero.
+
+    Price, FX and quantity updates are tracked, and revalue(incremental=True) only recalculates the positions they
+    affect, adjusting the book and currency totals by the difference.
+    """
+
+    def __init__(self, base_currency):
+        self.base_currency = base_currency
+        self.assets = Interner()
+        self.books = Interner()
+        self.currencies = Interner()
+        self.currencies.intern([base_currency])
+        self.asset_currency = np.zeros(0, dtype=np.int64)
+        self.price = np.zeros(0)
+        self.previous_price = np.zeros(0)
+        self.fx = np.ones(1)
+        self.previous_fx = np.ones(1)
+        self.position_book = np.zeros(0, dtype=np.int64)
+        self.position_asset = np.zeros(0, dtype=np.int64)
+        self.quantity = np.zeros(0)
+        self.market_value = np.zeros(0)
+        self.pnl = np.zeros(0)
+        self._position_index = {}  # (book index, asset index) -> position row
+        self._dirty_assets = set()
+        self._dirty_currencies = set()
+        self._dirty_positions = set()
+        self._valued = False
+        self.book_totals = self.currency_totals = None
+
+    def _resize_assets(self):
+        n = len(self.assets)
+        self.asset_currency = grow(self.asset_currency, n, 0)
+        self.price = grow(self.price, n, np.nan)
+        self.previous_price = grow(self.previous_price, n, np.nan)
+
+    def _resize_currencies(self):
+        n = len(self.currencies)
+        self.fx = grow(self.fx, n, np.nan)
+        self.previous_fx = grow(self.previous_fx, n, np.nan)
+
+    def set_asset_currencies(self, asset_ids, currencies):
+        """ The currency each asset is priced in - e.g. from the currency of each Asset. """
+        assets = self.assets.intern(asset_ids)
+        currency_indices = self.currencies.intern(currencies)
+        self._resize_assets()
+        self._resize_currencies()
+        self.asset_currency[assets] = currency_indices
+        self._valued = False  # Moving an asset between currencies changes its group, so needs a full revaluation
+
+    def set_fx_rates(self, fx_rates, previous=False):
+        """ :param fx_rates: A dict of currency -> value of one unit in the base currency """
+        currency_indices = self.currencies.intern(list(fx_rates.keys()))
+        self._resize_currencies()
+        target = self.previous_fx if previous else self.fx
+        target[currency_indices] = [float(rate) for rate in fx_rates.values()]
+        self._dirty_currencies.update(currency_indices.tolist())
+
+    def set_prices(self, asset_ids, prices, previous=False):
+        assets = self.assets.intern(asset_ids)
+        self._resize_assets()
+        target = self.previous_price if previous else self.price
+        target[assets] = np.asarray(prices, dtype=np.float64)
+        self._dirty_assets.update(assets.tolist())
+
+    def set_eod_prices(self, eod_prices, previous=False):
+        """ Load prices from EODPrice objects, such as those built in 'market-data-yahoo'. """
+        self.set_prices(asset_ids=[eod_price.asset_id for eod_price in eod_prices],
+                        prices=[float(eod_price.price) for eod_price in eod_prices], previous=previous)
+
+    def set_positions(self, book_ids, asset_ids, quantities):
+        """ Add or update positions.  Positions not mentioned are left unchanged. """
+        books = self.books.intern(book_ids)
+        assets = self.assets.intern(asset_ids)
+        self._resize_assets()
+        quantities = np.asarray(quantities, dtype=np.float64)
+        rows = np.empty(len(books), dtype=np.int64)
+        position_index = self._position_index
+        next_row = len(self.quantity)
+        for i, key in enumerate(zip(books.tolist(), assets.tolist())):
+            row = position_index.get(key)
+            if row is None:
+                row = position_index[key] = next_row
+                next_row += 1
+            rows[i] = row
+        new_rows = rows >= len(self.quantity)
+        self.position_book = grow(self.position_book, next_row, 0)
+        self.position_asset = grow(self.position_asset, next_row, 0)
+        self.quantity = grow(self.quantity, next_row, 0.0)
+        self.market_value = grow(self.market_value, next_row, 0.0)
+        self.pnl = grow(self.pnl, next_row, 0.0)
+        self.position_book[rows[new_rows]] = books[new_rows]
+        self.position_asset[rows[new_rows]] = assets[new_rows]
+        self.quantity[rows] = quantities
+        self._dirty_positions.update(rows.tolist())
+
+    def set_position_objects(self, positions):
+        """ Load positions from Position objects, such as those returned by position_search. """
+        self.set_positions(book_ids=[position.book_id for position in positions],
+                           asset_ids=[position.asset_id for position in positions],
+                           quantities=[float(position.quantity) for position in positions])
+
+    def _value(self, rows):
+        assets = self.position_asset[rows]
+        currencies = self.asset_currency[assets]
+        quantity = self.quantity[rows]
+        value = self.price[assets] * self.fx[currencies]
+        previous_value = self.previous_price[assets] * self.previous_fx[currencies]
+        return quantity * value, quantity * (value - previous_value)
+
+    def revalue(self, incremental=False):
+        """
+        Recalculate market value and P&L.
+        :param incremental: Only revalue positions whose price, FX rate or quantity has changed since the last
+        revaluation.  Totals are adjusted by the change in value of those positions.
+        :return: The number of positions revalued
+        """
+        if incremental and self._valued:
+            changed = np.zeros(len(self.quantity), dtype=bool)
+            changed[list(self._dirty_positions)] = True
+            dirty_assets = np.zeros(len(self.assets), dtype=bool)
+            dirty_assets[list(self._dirty_assets)] = True
+            if self._dirty_currencies:
+                dirty_assets |= np.isin(self.asset_currency, list(self._dirty_currencies))
+            rows = np.flatnonzero(changed | dirty_assets[self.position_asset])
+            old_market_value, old_pnl = self.market_value[rows], self.pnl[rows]
+        else:
+            rows = np.arange(len(self.quantity))
+            old_market_value = old_pnl = np.zeros(len(rows))
+            self.book_totals = self.currency_totals = None
+        market_value, pnl = self._value(rows)
+        self.market_value[rows] = market_value
+        self.pnl[rows] = pnl
+        books = self.position_book[rows]
+        currencies = self.asset_currency[self.position_asset[rows]]
+        self.book_totals = self._adjust(self.book_totals, books, len(self.books),
+                                        old_market_value, market_value, old_pnl, pnl)
+        self.currency_totals = self._adjust(self.currency_totals, currencies, len(self.currencies),
+                                            old_market_value, market_value, old_pnl, pnl)
+        self._dirty_assets.clear()
+        self._dirty_currencies.clear()
+        self._dirty_positions.clear()
+        self._valued = True
+        return len(rows)
+
+    @staticmethod
+    def _adjust(totals, groups, no_of_groups, old_market_value, market_value, old_pnl, pnl):
+        """
+        Add the change in value of some positions to the totals for their groups (books or currencies).
+
+        Totals are held as an array of [market value, P&L, number of unpriced positions] per group.  Unpriced (NaN)
+        positions are counted rather than summed, so that a total can recover once the missing price arrives.
+        """
+        if totals is None:
+            totals = np.zeros((no_of_groups, 3))
+        elif len(totals) < no_of_groups:
+            totals = np.concatenate([totals, np.zeros((no_of_groups - len(totals), 3))])
+        totals[:, 0] += np.bincount(groups, np.nan_to_num(market_value) - np.nan_to_num(old_market_value),
+                                    minlength=no_of_groups)
+        totals[:, 1] += np.bincount(groups, np.nan_to_num(pnl) - np.nan_to_num(old_pnl), minlength=no_of_groups)
+        totals[:, 2] += np.bincount(groups, np.isnan(market_value).astype(np.float64) -
+                                    np.isnan(old_market_value), minlength=no_of_groups)
+        return totals
+
+    def by_book(self):
+        """ :return: A dict of book_id -> (market value, P&L, number of unpriced positions) in the base currency """
+        return {book_id: tuple(self.book_totals[i]) for i, book_id in enumerate(self.books.keys)}
+
+    def by_currency(self):
+        """ :return: A dict of currency -> (market value, P&L, number of unpriced positions) in the base currency """
+        return {currency: tuple(self.currency_totals[i]) for i, currency in enumerate(self.currencies.keys)}
+
+    def total(self):
+        """ :return: A tuple of (market value, P&L, number of unpriced positions) in the base currency """
+        return tuple(self.book_totals.sum(axis=0))
+
+
+def main():
+    """ Main example """
+    logging.info("--- SETTING UP IDENTIFIERS ---")
+    asset_manager_id = random.randint(1, 2**31-1)
+    base_currency = 'USD'  # The base_currency of the asset manager's Company
+    currencies = ['HKD', 'SGD', 'JPY', 'USD']
+    fx_rates = {'HKD': Decimal('0.1282'), 'SGD': Decimal('0.7391'), 'JPY': Decimal('0.0089'), 'USD': Decimal('1')}
+    no_of_books = 200
+    no_of_assets = 10000
+    no_of_positions = 2000000
+    business_date = date.today()
+    previous_date = business_date - relativedelta(days=1)
+    asset_ids = ['EQ' + str(i+1) for i in range(no_of_assets)]
+    book_ids = ['BOOK' + str(i+1) for i in range(no_of_books)]
+    engine = ValuationEngine(base_currency=base_currency)
+
+    logging.info("--- LOADING ASSETS, PRICES AND FX RATES ---")
+    engine.set_asset_currencies(asset_ids=asset_ids, currencies=[random.choice(currencies) for _ in asset_ids])
+    previous_prices = [Decimal(random.uniform(1, 500)).quantize(Decimal('0.01')) for _ in asset_ids]
+    engine.set_eod_prices([EODPrice(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                    business_date=previous_date, price=price)
+                           for asset_id, price in zip(asset_ids, previous_prices)], previous=True)
+    engine.set_eod_prices([EODPrice(asset_manager_id=asset_manager_id, asset_id=asset_id,
+                                    business_date=business_date, price=price * Decimal(random.uniform(0.98, 1.02)))
+                           for asset_id, price in zip(asset_ids, previous_prices)])
+    engine.set_fx_rates(fx_rates, previous=True)
+    engine.set_fx_rates(fx_rates)
+
+    logging.info("--- LOADING %s POSITIONS ---", no_of_positions)
+    start = time.time()
+    # Positions from position_search can be loaded with set_position_objects - these are generated for scale
+    position_books = np.random.randint(0, no_of_books, no_of_positions)
+    position_assets = np.random.randint(0, no_of_assets, no_of_positions)
+    engine.set_positions(book_ids=[book_ids[i] for i in position_books],
+                         asset_ids=[asset_ids[i] for i in position_assets],
+                         quantities=np.random.randint(-10000, 10000, no_of_positions))
+    logging.info("Loaded %s distinct positions in %.2fs", len(engine.quantity), time.time() - start)
+
+    logging.info("--- FULL REVALUATION ---")
+    start = time.time()
+    revalued = engine.revalue()
+    market_value, pnl, unpriced = engine.total()
+    logging.info("Revalued %s positions in %.3fs - MV %.2f %s, P&L %.2f %s (%d unpriced)", revalued,
+                 time.time() - start, market_value, base_currency, pnl, base_currency, unpriced)
+    for currency, (currency_market_value, currency_pnl, _) in sorted(engine.by_currency().items()):
+        logging.info("%s: MV %.2f P&L %.2f", currency, currency_market_value, currency_pnl)
+
+    logging.info("--- INCREMENTAL REVALUATION AFTER 1% PRICE MOVES AND 1000 FILLS ---")
+    moved = random.sample(asset_ids, no_of_assets // 100)
+    engine.set_prices(asset_ids=moved, prices=[random.uniform(1, 500) for _ in moved])
+    engine.set_positions(book_ids=random.sample(book_ids, 10) * 100, asset_ids=random.sample(asset_ids, 1000),
+                         quantities=np.random.randint(-10000, 10000, 1000))
+    start = time.time()
+    revalued = engine.revalue(incremental=True)
+    market_value, pnl, unpriced = engine.total()
+    logging.info("Revalued %s positions in %.3fs - MV %.2f %s, P&L %.2f %s (%d unpriced)", revalued,
+                 time.time() - start, market_value, base_currency, pnl, base_currency, unpriced)
+
+if __name__ == '__main__':
+    main()